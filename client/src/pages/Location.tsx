@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useCallback } from 'react';
-import { MapContainer, TileLayer, Marker, Popup, useMap, GeoJSON, ImageOverlay } from 'react-leaflet';
+import { MapContainer, TileLayer, Marker, Popup, useMap, GeoJSON } from 'react-leaflet';
 import * as L from 'leaflet';
 import Swal from 'sweetalert2';
 import 'leaflet/dist/leaflet.css';
@@ -11,10 +11,13 @@ import { useAuth } from '../misc/auth-context';
 import DatePicker from 'react-datepicker';
 import 'react-datepicker/dist/react-datepicker.css';
 
-const landsatDataURL = 'http://localhost:5000/get_landsat_data';
+const landsatServerURL = 'http://localhost:5000';
+const landsatJobsURL = `${landsatServerURL}/jobs`;
 
 const mapServiceURL = 'https://nimbus.cr.usgs.gov/arcgis/rest/services/LLook_Outlines/MapServer/1/';
 
+const wrsLookupURL = 'http://127.0.0.1:5000/wrs/lookup';
+
 const clickMarkerIcon = L.icon({
     iconUrl: 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.7.1/images/marker-icon.png',
     iconSize: [25, 41],
@@ -41,7 +44,7 @@ const Location: React.FC = () => {
     const [startDate, setStartDate] = useState<Date | null>(new Date('2024-09-01')); // Start date
     const [endDate, setEndDate] = useState<Date | null>(new Date('2024-10-01')); // End date
     const [cloudCover, setCloudCover] = useState<number>(30); // Cloud cover
-    const [imageUrl, setImageUrl] = useState<string | null>(null); // Image URL after fetching data
+    const [sceneTiles, setSceneTiles] = useState<{ url: string; bounds: L.LatLngBoundsExpression; maxZoom: number } | null>(null); // Tile layer after fetching data
 
     const [isLoading, setIsLoading] = useState(false);
 
@@ -89,14 +92,23 @@ const Location: React.FC = () => {
 
         try {
             const [lat, lng] = clickedCoordinate;
-            const url = `${landsatDataURL}?start_date=${startDate.toISOString().split('T')[0]}&end_date=${
+            const url = `${landsatJobsURL}?start_date=${startDate.toISOString().split('T')[0]}&end_date=${
                 endDate.toISOString().split('T')[0]
             }&num_scenes=1&cloud_cover=${cloudCover}&latitude=${lat}&longitude=${lng}`;
-            const response = await fetch(url);
-            const imageBlob = await response.blob();
-
-            const imageUrl = URL.createObjectURL(imageBlob);
-            setImageUrl(imageUrl);
+            let job = await (await fetch(url, { method: 'POST' })).json();
+            // Long-poll the job until the scene has been downloaded and processed.
+            while (job.status === 'pending' || job.status === 'running') {
+                // A busy server answers at once with retry_after instead of holding the poll.
+                if (job.retry_after) {
+                    await new Promise((resolve) => setTimeout(resolve, job.retry_after * 1000));
+                }
+                job = await (await fetch(`${landsatServerURL}${job.status_url}?wait=20`)).json();
+            }
+            if (job.status !== 'done') {
+                throw new Error(job.error);
+            }
+            const data = job.result;
+            setSceneTiles({ url: `${landsatServerURL}${data.tiles}`, bounds: data.bounds, maxZoom: data.maxzoom });
         } catch (error) {
             console.error('Error fetching Landsat image data:', error);
             showSnackbar('Error fetching Landsat image data.');
@@ -138,6 +150,18 @@ const Location: React.FC = () => {
             const docRef = doc(db, 'reminders', email as string);
             console.log('Updating reminders:', newList);
             await setDoc(docRef, { all: newList });
+            // Mirror the list to the server, which sends the reminders. The ID token proves
+            // the list belongs to the signed-in user.
+            currentUser
+                ?.getIdToken()
+                .then((idToken) =>
+                    fetch(`${landsatServerURL}/reminders/${encodeURIComponent(email as string)}`, {
+                        method: 'PUT',
+                        headers: { 'Content-Type': 'application/json', Authorization: `Bearer ${idToken}` },
+                        body: JSON.stringify({ all: newList }),
+                    })
+                )
+                .catch((error) => console.error('Error syncing reminders:', error));
             setRemindersList(newList);
             if (!isReminderEnabled()) {
                 Swal.fire({
@@ -215,12 +239,16 @@ const Location: React.FC = () => {
             setWrsFeatures(null);
             const { lat, lng } = e.latlng;
             setClickedCoordinate([lat, lng]);
-            setImageUrl(null);
+            setSceneTiles(null);
 
             const url = `${mapServiceURL}query?where=MODE='D'&geometry=${lng},${lat}&geometryType=esriGeometryPoint&spatialRel=esriSpatialRelIntersects&outFields=*&returnGeometry=true&returnTrueCurves=false&returnIdsOnly=false&returnCountOnly=false&returnZ=false&returnM=false&returnDistinctValues=false&f=geojson`;
 
             try {
-                const response = await fetch(url);
+                // Resolve the footprint locally, falling back to the USGS map service.
+                let response = await fetch(`${wrsLookupURL}?format=geojson&latitude=${lat}&longitude=${lng}`).catch(() => null);
+                if (!response || !response.ok) {
+                    response = await fetch(url);
+                }
                 const data = await response.json();
                 console.log('Fetch response:', data);
 
@@ -399,7 +427,7 @@ const Location: React.FC = () => {
                         </Popup>
                     </Marker>
                 )}
-                {showLastAqData && currentBlockBounds && <ImageOverlay url={imageUrl || ''} bounds={currentBlockBounds} className="img_overlay" />}
+                {showLastAqData && sceneTiles && <TileLayer url={sceneTiles.url} bounds={sceneTiles.bounds} maxNativeZoom={sceneTiles.maxZoom} />}
                 <MapEvents />
             </MapContainer>
             {snackbar && (
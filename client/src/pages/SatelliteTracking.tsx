@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useCallback } from 'react';
-import { MapContainer, Marker, Popup, useMap } from 'react-leaflet';
+import { MapContainer, Marker, Popup, Polyline, useMap } from 'react-leaflet';
 import { BasemapLayer } from 'react-esri-leaflet';
 import * as L from 'leaflet';
 import 'leaflet/dist/leaflet.css';
@@ -16,6 +16,30 @@ interface SatelliteDataMap {
     [key: string]: SatelliteData;
 }
 
+interface GroundTrack {
+    start: string;
+    step: number;
+    latitude: number[];
+    longitude: number[];
+    altitude: number[];
+}
+
+interface GroundTrackMap {
+    [key: string]: GroundTrack;
+}
+
+// Split the track where it crosses the antimeridian so Leaflet doesn't draw a line across the map.
+const splitGroundTrack = (track: GroundTrack): [number, number][][] => {
+    const segments: [number, number][][] = [[]];
+    track.latitude.forEach((latitude, i) => {
+        if (i > 0 && Math.abs(track.longitude[i] - track.longitude[i - 1]) > 180) {
+            segments.push([]);
+        }
+        segments[segments.length - 1].push([latitude, track.longitude[i]]);
+    });
+    return segments;
+};
+
 const satelliteIcon = L.icon({
     iconUrl: 'https://static.vecteezy.com/system/resources/previews/033/529/060/non_2x/starlink-satellite-ai-generative-free-png.png',
     iconSize: [25, 41],
@@ -27,26 +51,67 @@ const SatelliteTracker: React.FC = () => {
     const [selectedSatellite, setSelectedSatellite] = useState<string>('');
     const [autoFocus, setAutoFocus] = useState<boolean>(true);
     const [satelliteData, setSatelliteData] = useState<SatelliteDataMap>({});
+    const [groundTracks, setGroundTracks] = useState<GroundTrackMap>({});
 
-    const fetchSatelliteData = useCallback(async () => {
-        try {
-            const response = await fetch('http://127.0.0.1:5000/satellite-data');
-            const data = await response.json();
+    useEffect(() => {
+        let source: EventSource | null = null;
+        let poller: ReturnType<typeof setInterval> | undefined;
+        let reconnect: ReturnType<typeof setTimeout> | undefined;
+        const showPositions = (data: SatelliteDataMap) => {
             setSatelliteData(data);
-            if (!selectedSatellite) {
-                const firstSatelliteKey = Object.keys(data)[0];
-                setSelectedSatellite(firstSatelliteKey);
+            setSelectedSatellite((prev) => prev || Object.keys(data)[0]);
+        };
+        const poll = async () => {
+            try {
+                const response = await fetch('http://127.0.0.1:5000/satellite-data');
+                if (response.ok) {
+                    showPositions(await response.json());
+                }
+            } catch (error) {
+                console.error('Error fetching satellite data:', error);
             }
+        };
+        const connect = () => {
+            source = new EventSource('http://127.0.0.1:5000/satellite-stream');
+            source.onmessage = (event) => showPositions(JSON.parse(event.data));
+            // A server with no stream to spare asks for polling, and for the stream to be tried again later.
+            source.addEventListener('poll', (event) => {
+                const { interval, retry } = JSON.parse((event as MessageEvent).data);
+                source?.close();
+                poll();
+                poller = setInterval(poll, interval * 1000);
+                reconnect = setTimeout(() => {
+                    clearInterval(poller);
+                    connect();
+                }, retry * 1000);
+            });
+            source.onerror = (error) => {
+                console.error('Error in satellite data stream:', error);
+            };
+        };
+        connect();
+        return () => {
+            source?.close();
+            clearInterval(poller);
+            clearTimeout(reconnect);
+        };
+    }, []);
+
+    const fetchGroundTracks = useCallback(async () => {
+        try {
+            const response = await fetch('http://127.0.0.1:5000/ground-track?minutes=100&step=30');
+            const data = await response.json();
+            setGroundTracks(data);
         } catch (error) {
-            console.error('Error fetching satellite data:', error);
+            console.error('Error fetching ground tracks:', error);
         }
-    }, [selectedSatellite]);
+    }, []);
 
     useEffect(() => {
-        fetchSatelliteData();
-        const interval = setInterval(fetchSatelliteData, 5000);
+        fetchGroundTracks();
+        const interval = setInterval(fetchGroundTracks, 10 * 60 * 1000);
         return () => clearInterval(interval);
-    }, [fetchSatelliteData]);
+    }, [fetchGroundTracks]);
 
     const MapEvents: React.FC = () => {
         const map = useMap();
@@ -97,6 +162,9 @@ const SatelliteTracker: React.FC = () => {
             </div>
             <MapContainer id="map" center={[23.685, 90.3563]} zoom={3} minZoom={2} maxZoom={10}>
                 <BasemapLayer name="Topographic" />
+                {selectedSatellite && groundTracks[selectedSatellite] && (
+                    <Polyline positions={splitGroundTrack(groundTracks[selectedSatellite])} pathOptions={{ color: 'red', weight: 2, opacity: 0.7 }} />
+                )}
                 {selectedSatellite && satelliteData[selectedSatellite] && (
                     <Marker position={[satelliteData[selectedSatellite].latitude, satelliteData[selectedSatellite].longitude]} icon={satelliteIcon}>
                         <Popup>
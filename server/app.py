@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_file, g, send_from_directory, abort
+from flask import Flask, Response, request, jsonify, send_file, g, abort
 from flask_cors import CORS
 import requests
 from skyfield.api import EarthSatellite, load
@@ -7,34 +7,156 @@ import numpy as np
 from PIL import Image
 import json
 import re
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 import time
 import os
 import shutil
 import subprocess
+import tempfile
+import threading
+import atexit
+import gc
+from concurrent.futures import ThreadPoolExecutor
 
 from config import Config
+from m2m import SERVICE_URL, M2MSession
+from schedule import CYCLES_URL, AcquisitionSchedule
+from tle import TLEStore
+from ephemeris import GroundTrackCache, OverpassPredictor, aligned_start
+from stream import PositionBroadcaster
+from wrs import get_wrs_index
+from image_cache import ImageCache
+from tiles import TilePyramid, bounds_from_geometry
+from encoding import DEFAULT_ENCODING, FORMATS, encode_image, parse_encoding, variant_params
+from downloads import DownloadPool
+from jobs import JobQueue
+from bands import BANDS, BandReader, rasterio
+from indices import INDICES, SpectralIndex
+from catalog import REPEAT_DAYS, SceneCatalog, parse_display_id
+from reminders import ReminderScheduler, open_reminder_store
+from auth import bearer_token, firebase_user_email, is_admin
+from composite import METHODS as COMPOSITE_METHODS, SceneStack, align, composite
+from metrics import (DOWNLOADED_BYTES, MEMORY_BYTES, REQUEST_SECONDS, MetricsWriter, count_cache, end_request,
+                     registry, stage, start_request)
+from profiler import SlowRequestProfiler
+from static_files import StaticFiles
+from utils import memory_usage
+from functools import lru_cache
 
 
 app = Flask(__name__)
 CORS(app)
 
+M2M_SERVICE_URL = getattr(Config, "M2M_SERVICE_URL", SERVICE_URL)
+CELESTRAK_URL = getattr(Config, "CELESTRAK_URL", "https://celestrak.org/NORAD/elements/gp.php")
+CYCLES_URL = getattr(Config, "CYCLES_URL", CYCLES_URL)
+M2M_POOL_SIZE = getattr(Config, "M2M_POOL_SIZE", 10)
+M2M_TOKEN_TTL = getattr(Config, "M2M_TOKEN_TTL", 6600)
+CACHE_DIR = getattr(Config, "CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+CYCLES_REFRESH_INTERVAL = getattr(Config, "CYCLES_REFRESH_INTERVAL", 6 * 3600)
+MAX_BATCH_PATHS = getattr(Config, "MAX_BATCH_PATHS", 5000)
+TLE_MAX_AGE = getattr(Config, "TLE_MAX_AGE", 12 * 3600)
+GROUND_TRACK_ALIGN = getattr(Config, "GROUND_TRACK_ALIGN", 300)
+GROUND_TRACK_MAX_POINTS = getattr(Config, "GROUND_TRACK_MAX_POINTS", 20000)
+STREAM_INTERVAL = getattr(Config, "STREAM_INTERVAL", 1.0)
+STREAM_QUEUE_SIZE = getattr(Config, "STREAM_QUEUE_SIZE", 2)
+# Open /satellite-stream connections per worker process; each holds a server thread.
+# Further clients poll /satellite-data every STREAM_POLL_INTERVAL seconds and try the
+# stream again after STREAM_RETRY. The async app's stream has no such limit.
+STREAM_MAX_CLIENTS = getattr(Config, "STREAM_MAX_CLIENTS", 4)
+STREAM_POLL_INTERVAL = getattr(Config, "STREAM_POLL_INTERVAL", 5)
+STREAM_RETRY = getattr(Config, "STREAM_RETRY", 60)
+WRS_DIR = getattr(Config, "WRS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "landsat_wrs"))
+MAX_BATCH_POINTS = getattr(Config, "MAX_BATCH_POINTS", 10000)
+OVERPASS_STEP = getattr(Config, "OVERPASS_STEP", 30)
+OVERPASS_ALIGN = getattr(Config, "OVERPASS_ALIGN", 3600)
+OVERPASS_MAX_DAYS = getattr(Config, "OVERPASS_MAX_DAYS", 16)
+MAX_OVERPASS_POINTS = getattr(Config, "MAX_OVERPASS_POINTS", 1000)
+IMAGE_CACHE_MAX_BYTES = getattr(Config, "IMAGE_CACHE_MAX_BYTES", 2 * 1024 ** 3)
+TILE_MEMORY_BYTES = getattr(Config, "TILE_MEMORY_BYTES", 512 * 1024 ** 2)
+PROCESS_STRIP_BYTES = getattr(Config, "PROCESS_STRIP_BYTES", 16 * 1024 ** 2)
+MAX_IMAGE_BYTES = getattr(Config, "MAX_IMAGE_BYTES", 1024 ** 3)
+DOWNLOAD_WORKERS = getattr(Config, "DOWNLOAD_WORKERS", 4)
+DOWNLOAD_TIMEOUT = getattr(Config, "DOWNLOAD_TIMEOUT", 300)
+DOWNLOAD_READ_TIMEOUT = getattr(Config, "DOWNLOAD_READ_TIMEOUT", 60)
+DOWNLOAD_SPOOL_BYTES = getattr(Config, "DOWNLOAD_SPOOL_BYTES", 16 * 1024 ** 2)
+DOWNLOAD_SPOOL_DIR = getattr(Config, "DOWNLOAD_SPOOL_DIR", None)
+COMPOSITE_STRIP_BYTES = getattr(Config, "COMPOSITE_STRIP_BYTES", 64 * 1024 ** 2)
+BANDS_ROOT = getattr(Config, "BANDS_ROOT", os.path.join(CACHE_DIR, "bands"))
+BAND_MAX_RADIUS = getattr(Config, "BAND_MAX_RADIUS", 50000)
+BAND_MAX_SIZE = getattr(Config, "BAND_MAX_SIZE", 4096)
+INDEX_BLOCK_SIZE = getattr(Config, "INDEX_BLOCK_SIZE", 512)
+MAX_SAMPLE_POINTS = getattr(Config, "MAX_SAMPLE_POINTS", 10000)
+MAX_SAMPLE_SCENES = getattr(Config, "MAX_SAMPLE_SCENES", 100)
+CATALOG_SETTLE_DAYS = getattr(Config, "CATALOG_SETTLE_DAYS", 14)
+CATALOG_PAGE_SIZE = getattr(Config, "CATALOG_PAGE_SIZE", 500)
+REMINDER_STORE = getattr(Config, "REMINDER_STORE", os.path.join(CACHE_DIR, "reminders.json"))
+REMINDER_WEBHOOK = getattr(Config, "REMINDER_WEBHOOK", None)
+REMINDER_LEAD_DAYS = getattr(Config, "REMINDER_LEAD_DAYS", 1)
+REMINDER_INTERVAL = getattr(Config, "REMINDER_INTERVAL", 3600)
+REMINDER_SCHEDULER = getattr(Config, "REMINDER_SCHEDULER", False)
+# Web API key of the Firebase project the client signs in with; needed to accept reminder updates.
+FIREBASE_API_KEY = getattr(Config, "FIREBASE_API_KEY", None)
+# Bearer token for /reminders/due and /reminders/run; without one they are disabled.
+REMINDER_ADMIN_TOKEN = getattr(Config, "REMINDER_ADMIN_TOKEN", None)
+JOB_WORKERS = getattr(Config, "JOB_WORKERS", 4)
+# Decoded scenes waiting for their full-resolution PNG to be cached, per worker process.
+MASTER_QUEUE_SIZE = getattr(Config, "MASTER_QUEUE_SIZE", 2)
+JOB_TTL = getattr(Config, "JOB_TTL", 600)
+JOB_MAX_WAIT = getattr(Config, "JOB_MAX_WAIT", 25)
+# Concurrent /jobs?wait= long-polls per worker process; past this, polls answer at once.
+JOB_MAX_WAITERS = getattr(Config, "JOB_MAX_WAITERS", 4)
+JOB_RETRY_AFTER = getattr(Config, "JOB_RETRY_AFTER", 2)
+# Worker processes share their metrics through files here, so any of them can answer /metrics.
+METRICS_DIR = getattr(Config, "METRICS_DIR", os.path.join(CACHE_DIR, "metrics"))
+METRICS_INTERVAL = getattr(Config, "METRICS_INTERVAL", 5)
+STATIC_DIR = getattr(Config, "STATIC_DIR", app.static_folder)
+STATIC_MAX_AGE = getattr(Config, "STATIC_MAX_AGE", 3600)
+STATIC_MAX_INLINE_BYTES = getattr(Config, "STATIC_MAX_INLINE_BYTES", 1024 ** 2)
+# Requests slower than this many seconds get their sampled stacks written to PROFILE_DIR; None turns sampling off.
+PROFILE_SLOW_REQUESTS = getattr(Config, "PROFILE_SLOW_REQUESTS", None)
+PROFILE_INTERVAL = getattr(Config, "PROFILE_INTERVAL", 0.005)
+PROFILE_DIR = getattr(Config, "PROFILE_DIR", os.path.join(CACHE_DIR, "profiles"))
+
+# Bump when process_image changes so stale cached images are not served.
+PROCESSING_VERSION = "black-mask-v1"
+
+# Pillow refuses to open images far beyond this many pixels; match it to the smallest
+# single-band image that decode_image would reject anyway.
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_BYTES // 5
+
 ts = load.timescale()
 
 def get_tle(catalog_number):
     url = (
-        f"https://celestrak.org/NORAD/elements/gp.php?CATNR={catalog_number}&FORMAT=TLE"
+        f"{CELESTRAK_URL}?CATNR={catalog_number}&FORMAT=TLE"
     )
-    response = requests.get(url)
+    with stage("celestrak"):
+        response = requests.get(url, timeout=30)
+    DOWNLOADED_BYTES.inc(len(response.content), source="celestrak")
+    response.raise_for_status()
     return response.text.splitlines()
 
 
-landsat_8_tle = get_tle(39084)
-landsat_9_tle = get_tle(49260)
+LANDSAT_8 = 39084
+LANDSAT_9 = 49260
+
+tle_store = TLEStore(CACHE_DIR, fetch=get_tle, max_age=TLE_MAX_AGE)
+ground_tracks = GroundTrackCache(ts)
+overpass_predictor = OverpassPredictor(ts)
+
+SATELLITES = {"landsat_8": LANDSAT_8, "landsat_9": LANDSAT_9}
+
+acquisition_schedule = AcquisitionSchedule(CACHE_DIR, url=CYCLES_URL, refresh_interval=CYCLES_REFRESH_INTERVAL)
+
+
+@lru_cache(maxsize=8)
+def get_earth_satellite(tle):
+    return EarthSatellite(tle[1], tle[2], tle[0], ts)
 
 
 def get_satellite_data(tle):
-    satellite = EarthSatellite(tle[1], tle[2], tle[0], ts)
+    satellite = get_earth_satellite(tle)
     t = ts.now()
     geocentric = satellite.at(t)
     subpoint = geocentric.subpoint()
@@ -54,57 +176,163 @@ def get_satellite_data(tle):
 
 
 def get_next_acquisition_date(path):
-    current_time = datetime.now(timezone.utc)
-    path_date = f"{current_time.month}/{current_time.day}/{current_time.year}"
+    return acquisition_schedule.next_acquisition(path)
 
-    next_acq_l8 = None
-    next_acq_l9 = None
 
-    try:
-        response = requests.get(
-            "https://landsat.usgs.gov/sites/default/files/landsat_acq/assets/json/cycles_full.json"
-        )
-        response.raise_for_status()
-        data = response.json()
-    except (requests.exceptions.RequestException, ValueError) as e:
-        print(f"Error fetching data: {e}")
+def get_all_satellite_data():
+    landsat_8_tle = tle_store.get(LANDSAT_8)
+    landsat_9_tle = tle_store.get(LANDSAT_9)
+    if landsat_8_tle is None or landsat_9_tle is None:
         return None
+    landsat_8_data = get_satellite_data(landsat_8_tle)
+    landsat_9_data = get_satellite_data(landsat_9_tle)
+    return {"landsat_8": landsat_8_data, "landsat_9": landsat_9_data}
 
-    try:
-        today_cycle_l8 = data["landsat_8"][path_date]["cycle"]
-        today_cycle_l9 = data["landsat_9"][path_date]["cycle"]
-    except KeyError:
-        print("Error: Path date not found in data.")
-        return None
 
-    def find_next_acquisition(satellite_data, today_cycle, max_iterations):
-        for i in range(1, max_iterations + 1):
-            path_info = satellite_data.get(f"1/{i}/2024")
-            if not path_info:
-                continue
-            path_str = path_info.get("path", "")
-            path_split = path_str.split(",")
-
-            if path in path_split:
-                cycle = path_info["cycle"]
-                diff = int(cycle) - int(today_cycle)
-                if diff < 0:
-                    diff += 16
-                next_acq_date = current_time + timedelta(days=diff)
-                return f"{next_acq_date.month}/{next_acq_date.day}/{next_acq_date.year}"
-        return None
+position_broadcaster = PositionBroadcaster(get_all_satellite_data,
+                                           interval=STREAM_INTERVAL,
+                                           queue_size=STREAM_QUEUE_SIZE,
+                                           max_subscribers=STREAM_MAX_CLIENTS,
+                                           poll_interval=STREAM_POLL_INTERVAL,
+                                           retry=STREAM_RETRY)
 
-    next_acq_l8 = find_next_acquisition(data["landsat_8"], today_cycle_l8, 16)
-    next_acq_l9 = find_next_acquisition(data["landsat_9"], today_cycle_l9, 31)
+slow_request_profiler = (SlowRequestProfiler(PROFILE_SLOW_REQUESTS, PROFILE_DIR, interval=PROFILE_INTERVAL)
+                         if PROFILE_SLOW_REQUESTS is not None else None)
+
+
+@app.before_request
+def start_timing():
+    g.timings, g.timings_token = start_request()
+    if slow_request_profiler is not None:
+        slow_request_profiler.start()
+
+
+@app.after_request
+def add_server_timing(response):
+    timings = getattr(g, "timings", None)
+    if timings is None:
+        return response
+    response.headers["Server-Timing"] = timings.header()
+    response.headers["Timing-Allow-Origin"] = "*"
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    REQUEST_SECONDS.observe(timings.elapsed(), method=request.method, endpoint=endpoint, status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def stop_timing(error=None):
+    timings = g.pop("timings", None)
+    if timings is None:
+        return
+    end_request(g.pop("timings_token"))
+    if slow_request_profiler is not None:
+        slow_request_profiler.stop(request.path, timings.elapsed())
+
+
+def update_memory_metrics():
+    for kind, value in memory_usage().items():
+        MEMORY_BYTES.set(value, kind=kind)
+
+
+# Started in each worker process (see after_fork); the single-process dev server doesn't need it.
+metrics_writer = MetricsWriter(registry, METRICS_DIR, interval=METRICS_INTERVAL, before_write=update_memory_metrics)
+
+
+@app.route("/metrics")
+def metrics():
+    update_memory_metrics()
+    directory = METRICS_DIR if metrics_writer.running else None
+    return Response(registry.render(directory), mimetype="text/plain; version=0.0.4")
 
-    return next_acq_l8, next_acq_l9
 
 
 @app.route("/satellite-data")
 def satellite_data():
-    landsat_8_data = get_satellite_data(landsat_8_tle)
-    landsat_9_data = get_satellite_data(landsat_9_tle)
-    return jsonify({"landsat_8": landsat_8_data, "landsat_9": landsat_9_data})
+    data = get_all_satellite_data()
+    if data is None:
+        return {"error": "TLE data unavailable."}, 503
+    return jsonify(data)
+
+
+@app.route("/satellite-stream")
+def satellite_stream():
+    subscriber = position_broadcaster.subscribe()
+    return Response(position_broadcaster.events(subscriber),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/ground-track")
+def ground_track():
+    names = request.args.get("satellite")
+    names = names.split(",") if names else list(SATELLITES)
+    try:
+        window = int(float(request.args.get("minutes", 100)) * 60)
+        step = int(request.args.get("step", 30))
+    except ValueError:
+        return {"error": "Minutes and step must be numbers."}, 400
+    delta = request.args.get("delta", "0").lower() in ("1", "true")
+    if any(name not in SATELLITES for name in names):
+        return {"error": f"Satellite must be one of {', '.join(SATELLITES)}."}, 400
+    if step < 1 or window < step or window // step + 1 > GROUND_TRACK_MAX_POINTS:
+        return {"error": f"Window and step must give between 2 and {GROUND_TRACK_MAX_POINTS} points."}, 400
+
+    start = aligned_start(GROUND_TRACK_ALIGN)
+    tracks = {}
+    for name in names:
+        tle = tle_store.get(SATELLITES[name])
+        if tle is None:
+            return {"error": "TLE data unavailable."}, 503
+        tracks[name] = ground_tracks.get(get_earth_satellite(tle), tle, start, window, step, delta)
+    return jsonify(tracks)
+
+
+@app.route("/overpasses", methods=["GET", "POST"])
+def overpasses():
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+    else:
+        body = request.args
+    names = body.get("satellite")
+    if isinstance(names, str):
+        names = names.split(",")
+    names = names or list(SATELLITES)
+    if not isinstance(names, list) or any(not isinstance(name, str) or name not in SATELLITES for name in names):
+        return {"error": f"Satellite must be one of {', '.join(SATELLITES)}."}, 400
+    try:
+        if request.method == "POST":
+            points = body.get("points")
+            if not isinstance(points, list) or not 0 < len(points) <= MAX_OVERPASS_POINTS:
+                return {"error": f"Points must be a list of at most {MAX_OVERPASS_POINTS} points."}, 400
+            points = [parse_point(point) for point in points]
+        else:
+            points = [parse_point((body.get("latitude"), body.get("longitude")))]
+        count = int(body.get("count", 5))
+        days = float(body.get("days", 7))
+        min_elevation = float(body.get("min_elevation", 0))
+    except (TypeError, ValueError, IndexError):
+        return {"error": "Valid latitude, longitude, count, days and min_elevation are required."}, 400
+    if not 0 < days <= OVERPASS_MAX_DAYS or count < 1 or not -5 <= min_elevation < 90:
+        return {"error": f"Days must be at most {OVERPASS_MAX_DAYS}, count positive and min_elevation below 90."}, 400
+
+    now = datetime.now(timezone.utc)
+    start = aligned_start(OVERPASS_ALIGN, now)
+    # Propagate past the requested window so passes in progress at its end are complete.
+    window = int(days * 86400) + OVERPASS_ALIGN + 3600
+    results = [{"latitude": latitude, "longitude": longitude, "overpasses": []} for latitude, longitude in points]
+    for name in names:
+        tle = tle_store.get(SATELLITES[name])
+        if tle is None:
+            return {"error": "TLE data unavailable."}, 503
+        predicted = overpass_predictor.predict(get_earth_satellite(tle), tle, points, start, window,
+                                               OVERPASS_STEP, now, now + timedelta(days=days), count, min_elevation)
+        for result, passes in zip(results, predicted):
+            result["overpasses"].extend({"satellite": name, **overpass} for overpass in passes)
+    for result in results:
+        result["overpasses"] = sorted(result["overpasses"], key=lambda overpass: overpass["culmination"])[:count]
+    if request.method == "GET":
+        return jsonify(results[0])
+    return jsonify({"results": results})
 
 
 @app.route("/next-acq-date")
@@ -118,24 +346,265 @@ def next_acquisition_date():
     l8, l9 = date
     return jsonify({"landsat_8": l8, "landsat_9": l9})
 
+
+@app.route("/next-acq-dates", methods=["GET", "POST"])
+def next_acquisition_dates():
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        paths = body.get("paths")
+        rows = body.get("rows")
+    else:
+        paths = request.args.get("paths")
+        rows = request.args.get("rows")
+        paths = paths.split(",") if paths else None
+        rows = rows.split(",") if rows else None
+    if not paths or not isinstance(paths, list):
+        return {"error": "Paths parameter is required."}, 400
+    if len(paths) > MAX_BATCH_PATHS:
+        return {"error": f"At most {MAX_BATCH_PATHS} paths are allowed."}, 400
+    if rows is not None and (not isinstance(rows, list) or len(rows) != len(paths)):
+        return {"error": "Rows must have one entry per path."}, 400
+
+    dates = acquisition_schedule.next_acquisitions([str(path) for path in paths])
+    if dates is None:
+        return {"error": "Error fetching data."}, 500
+    results = []
+    for i, (l8, l9) in enumerate(dates):
+        result = {"path": paths[i], "landsat_8": l8, "landsat_9": l9}
+        if rows is not None:
+            result["row"] = rows[i]
+        results.append(result)
+    return jsonify({"results": results})
+
+
+def send_notifications(notifications):
+    if not REMINDER_WEBHOOK:
+        for notification in notifications:
+            print(f"Reminder for {notification['user']}: path {notification['path']} "
+                  f"is acquired by {notification['satellite']} on {notification['date']}")
+        return
+    response = requests.post(REMINDER_WEBHOOK, json={"notifications": notifications}, timeout=30)
+    response.raise_for_status()
+
+
+reminder_store = open_reminder_store(REMINDER_STORE)
+reminder_scheduler = ReminderScheduler(reminder_store, acquisition_schedule, send_notifications,
+                                       lead_days=REMINDER_LEAD_DAYS, interval=REMINDER_INTERVAL,
+                                       lock_filename=REMINDER_STORE + ".run.lock")
+if REMINDER_SCHEDULER:
+    reminder_scheduler.start()
+
+
+@app.route("/reminders/<user>", methods=["PUT"])
+def save_reminders(user):
+    # Users may only replace their own reminders: the Firebase ID token of the signed-in
+    # user must belong to the email the reminders are stored under.
+    if not FIREBASE_API_KEY:
+        return {"error": "Reminder sync is not configured."}, 503
+    id_token = bearer_token(request.headers.get("Authorization"))
+    if id_token is None:
+        return {"error": "A Firebase ID token is required."}, 401
+    try:
+        email = firebase_user_email(id_token, FIREBASE_API_KEY)
+    except requests.exceptions.RequestException as e:
+        return {"error": f"Failed to verify the ID token: {e}"}, 502
+    if email is None:
+        return {"error": "Invalid or expired ID token."}, 401
+    if email.lower() != user.lower():
+        return {"error": "Reminders can only be saved for the signed-in user."}, 403
+
+    reminders = (request.get_json(silent=True) or {}).get("all")
+    if not isinstance(reminders, list) or not all(isinstance(reminder, dict) for reminder in reminders):
+        return {"error": "Reminders must be a list."}, 400
+    reminder_store.save(user, reminders)
+    return jsonify({"user": user, "count": len(reminders)})
+
+
+@app.route("/reminders/due")
+def due_reminders():
+    if not is_admin(request.headers.get("Authorization"), REMINDER_ADMIN_TOKEN):
+        return {"error": "The reminder admin token is required."}, 403
+    notifications = reminder_scheduler.due()
+    if notifications is None:
+        return {"error": "Error fetching data."}, 500
+    return jsonify({"notifications": notifications})
+
+
+@app.route("/reminders/run", methods=["POST"])
+def run_reminders():
+    if not is_admin(request.headers.get("Authorization"), REMINDER_ADMIN_TOKEN):
+        return {"error": "The reminder admin token is required."}, 403
+    try:
+        sent = reminder_scheduler.run_once()
+    except requests.exceptions.RequestException as e:
+        return {"error": f"Failed to send notifications: {e}"}, 502
+    return jsonify({"sent": sent})
+
+
+def wrs_index():
+    return get_wrs_index(WRS_DIR, CACHE_DIR)
+
+
+def wrs_tile(index, path, row, geometry=True):
+    center = index.center(path, row)
+    if center is None:
+        return None
+    tile = {"path": int(path), "row": int(row), "center": {"latitude": center[0], "longitude": center[1]}}
+    if geometry:
+        tile["footprint"] = index.footprint(path, row)
+    return tile
+
+
+def parse_point(point):
+    if isinstance(point, dict):
+        point = (point.get("latitude"), point.get("longitude"))
+    latitude, longitude = float(point[0]), float(point[1])
+    if not -90 <= latitude <= 90:
+        raise ValueError("Latitude must be between -90 and 90.")
+    return latitude, longitude
+
+
+@app.route("/wrs/lookup", methods=["GET", "POST"])
+def wrs_lookup():
+    index = wrs_index()
+    if index is None:
+        return {"error": "WRS-2 index unavailable."}, 503
+
+    try:
+        if request.method == "POST":
+            points = (request.get_json(silent=True) or {}).get("points")
+            if not isinstance(points, list) or len(points) > MAX_BATCH_POINTS:
+                return {"error": f"Points must be a list of at most {MAX_BATCH_POINTS} points."}, 400
+            points = [parse_point(point) for point in points]
+        else:
+            points = [parse_point((request.args.get("latitude"), request.args.get("longitude")))]
+    except (TypeError, ValueError, IndexError):
+        return {"error": "Valid latitude and longitude are required."}, 400
+
+    results = [[{"path": path, "row": row} for path, row in index.lookup(*point)] for point in points]
+    if request.method == "GET" and request.args.get("format") == "geojson":
+        return jsonify({
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "geometry": index.footprint(tile["path"], tile["row"]),
+                "properties": {"PATH": tile["path"], "ROW": tile["row"], "MODE": "D"},
+            } for tile in results[0]],
+        })
+    if request.method == "GET":
+        return jsonify({"results": results[0]})
+    return jsonify({"results": results})
+
+
+@app.route("/wrs/footprint", methods=["GET", "POST"])
+def wrs_footprint():
+    index = wrs_index()
+    if index is None:
+        return {"error": "WRS-2 index unavailable."}, 503
+
+    try:
+        if request.method == "POST":
+            tiles = (request.get_json(silent=True) or {}).get("tiles")
+            if not isinstance(tiles, list) or len(tiles) > MAX_BATCH_POINTS:
+                return {"error": f"Tiles must be a list of at most {MAX_BATCH_POINTS} path/row pairs."}, 400
+            tiles = [(int(tile["path"]), int(tile["row"])) for tile in tiles]
+        else:
+            tiles = [(int(request.args.get("path")), int(request.args.get("row")))]
+    except (TypeError, ValueError, KeyError):
+        return {"error": "Valid path and row are required."}, 400
+
+    geometry = request.args.get("geometry", "1").lower() in ("1", "true")
+    results = [wrs_tile(index, path, row, geometry) for path, row in tiles]
+    if request.method == "GET":
+        if results[0] is None:
+            return {"error": "Path/row not found."}, 404
+        return jsonify(results[0])
+    return jsonify({"results": results})
+
+
+static_files = StaticFiles(STATIC_DIR, max_age=STATIC_MAX_AGE, max_inline_bytes=STATIC_MAX_INLINE_BYTES)
+
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    try:
-        if path != "" and os.path.exists(app.static_folder + '/' + path):
-            return send_from_directory(app.static_folder, path)
-        else:
-            return send_from_directory(app.static_folder, 'index.html')
-    except Exception as e:
-        app.logger.error('Error in serve', exc_info=True)
-        return jsonify({'error': 'Server error'}), 500
+    entry = static_files.lookup(path)
+    if entry is None:
+        return jsonify({'error': 'Client build not found.'}), 404
+    encoding = static_files.choose(entry, request.headers.get('Accept-Encoding', ''))
+    etag, filename, data = entry.variants[encoding]
+    headers = {'Cache-Control': entry.cache_control}
+    if len(entry.variants) > 1:
+        headers['Vary'] = 'Accept-Encoding'
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+    elif data is None:
+        response = send_file(filename, mimetype=entry.mimetype, etag=etag, conditional=True)
+    else:
+        response = Response(data, mimetype=entry.mimetype)
+        response.set_etag(etag)
+    response.headers.update(headers)
+    return response
+
+image_cache = ImageCache(os.path.join(CACHE_DIR, "images"), max_bytes=IMAGE_CACHE_MAX_BYTES)
+tile_pyramid = TilePyramid(image_cache, max_memory_bytes=TILE_MEMORY_BYTES)
+
+m2m_session = None
+m2m_session_lock = threading.Lock()
+
+
+download_pool = DownloadPool(max_workers=DOWNLOAD_WORKERS,
+                             timeout=DOWNLOAD_TIMEOUT,
+                             read_timeout=DOWNLOAD_READ_TIMEOUT,
+                             spool_bytes=DOWNLOAD_SPOOL_BYTES,
+                             spool_dir=DOWNLOAD_SPOOL_DIR)
+atexit.register(download_pool.shutdown)
+
+master_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="master")
+master_lock = threading.Lock()
+# Entity ids whose full-resolution PNG is queued on master_writer.
+pending_masters = set()
+atexit.register(master_writer.shutdown)
+
+scene_catalog = SceneCatalog(os.path.join(CACHE_DIR, "scenes.db"), settle_days=CATALOG_SETTLE_DAYS)
+atexit.register(scene_catalog.close)
+
+scene_jobs = JobQueue(os.path.join(CACHE_DIR, "jobs.db"), max_workers=JOB_WORKERS, ttl=JOB_TTL)
+job_waiters = threading.BoundedSemaphore(JOB_MAX_WAITERS)
+atexit.register(scene_jobs.shutdown)
+
+
+def get_m2m_session():
+    global m2m_session
+    with m2m_session_lock:
+        if m2m_session is None:
+            m2m_session = M2MSession(Config.USERNAME, Config.TOKEN,
+                                     service_url=M2M_SERVICE_URL,
+                                     pool_size=M2M_POOL_SIZE,
+                                     token_ttl=M2M_TOKEN_TTL)
+            atexit.register(m2m_session.close)
+        return m2m_session
+
+
+def cloud_cover(scene):
+    # M2M reports cloudCover as a string, and -1 when it is unknown; those rank last.
+    value = scene.get('cloudCover')
+    if value is None or value == '' or float(value) < 0:
+        return float('inf')
+    return float(value)
+
 
 class LandsatDownloader:
-    def __init__(self, username, token, path, start_date='2024-09-01', end_date=None, num_scenes=1, cloud_cover=30):
+    def __init__(self, username, token, path, start_date='2024-09-01', end_date=None, num_scenes=1, cloud_cover=30, session=None, catalog=None):
         self.username = username
         self.token = token
+        self.session = session
+        self.catalog = catalog
         self.path = path
-        self.service_url = "https://m2m.cr.usgs.gov/api/api/json/stable/"
+        self.service_url = M2M_SERVICE_URL
         self.api_key = None
         self.dataset_name = "Landsat 8-9"
         self.start_date = start_date
@@ -145,9 +614,13 @@ class LandsatDownloader:
         self.cloud_cover = cloud_cover
 
     def send_request(self, endpoint, data, api_key=None):
+        if self.session is not None:
+            return self.session.send_request(endpoint, data)
         url = self.service_url + endpoint
         headers = {'X-Auth-Token': api_key} if api_key else {}
-        response = requests.post(url, json.dumps(data), headers=headers)
+        with stage(endpoint):
+            response = requests.post(url, json.dumps(data), headers=headers)
+        DOWNLOADED_BYTES.inc(len(response.content), source="m2m")
         response.raise_for_status()
         output = response.json()
         if 'errorCode' in output and output['errorCode'] is not None:
@@ -155,10 +628,18 @@ class LandsatDownloader:
         return output['data']
     
     def login(self):
+        if self.session is not None:
+            self.api_key = self.session.get_api_key()
+            return
         self.api_key = self.send_request("login-token", {'username': self.username, 'token': self.token})
         print("API Key obtained.")
 
     def convert_wrs_to_latlon(self, wrs_path, wrs_row):
+        index = wrs_index()
+        if index is not None:
+            center = index.center(wrs_path, wrs_row)
+            if center is not None:
+                return center
         payload = {'gridType': 'WRS2', 'path': str(wrs_path), 'row': str(wrs_row), 'responseShape': 'point'}
         response = self.send_request("grid2ll", payload, self.api_key)
         coords = response.get('coordinates', [])
@@ -168,8 +649,8 @@ class LandsatDownloader:
             return lat, lon
         raise KeyError("Latitude/Longitude not found in grid2ll response")
 
-    def search_datasets(self, latitude, longitude):
-        payload = {
+    def dataset_search_payload(self, latitude, longitude):
+        return {
             'datasetName': self.dataset_name,
             'temporalFilter': {'start': self.start_date, 'end': self.end_date},
             'spatialFilter': {
@@ -178,12 +659,14 @@ class LandsatDownloader:
                 'upperRight': {'latitude': latitude + 0.01, 'longitude': longitude + 0.01}
             }
         }
-        datasets = self.send_request("dataset-search", payload, self.api_key)
+
+    def search_datasets(self, latitude, longitude):
+        datasets = self.send_request("dataset-search", self.dataset_search_payload(latitude, longitude), self.api_key)
         print(f"Found {len(datasets)} datasets.")
         return datasets
 
-    def search_scenes(self, dataset, latitude, longitude):
-        payload = {
+    def scene_search_payload(self, dataset, latitude, longitude):
+        return {
             'datasetName': dataset,
             'maxResults': self.num_scenes,
             'startingNumber': 1,
@@ -198,109 +681,812 @@ class LandsatDownloader:
                 'browseOnly': True
             }
         }
-        scenes = self.send_request("scene-search", payload, self.api_key)
+
+    def search_scenes(self, dataset, latitude, longitude):
+        scenes = self.send_request("scene-search", self.scene_search_payload(dataset, latitude, longitude), self.api_key)
         print(f"Found {scenes['recordsReturned']} scenes.")
         return scenes
 
-    def get_processed_image(self, latitude, longitude):
+    def tile_search_payload(self, dataset, latitude, longitude, start_date, end_date, starting_number):
+        # Every browsable scene around a tile center, regardless of cloud cover.
+        return {
+            'datasetName': dataset,
+            'maxResults': CATALOG_PAGE_SIZE,
+            'startingNumber': starting_number,
+            'sceneFilter': {
+                'acquisitionFilter': {'start': start_date, 'end': end_date},
+                'spatialFilter': {
+                    'filterType': 'mbr',
+                    'lowerLeft': {'latitude': latitude - 0.01, 'longitude': longitude - 0.01},
+                    'upperRight': {'latitude': latitude + 0.01, 'longitude': longitude + 0.01}
+                },
+                'browseOnly': True
+            }
+        }
+
+    @staticmethod
+    def next_page(scenes):
+        # The startingNumber of the next scene-search page, or None after the last one.
+        next_record = scenes.get('nextRecord')
+        if not scenes['recordsReturned'] or not next_record or next_record > scenes.get('totalHits', 0):
+            return None
+        return next_record
+
+    def search_tile(self, dataset, latitude, longitude, start_date, end_date):
+        results = []
+        starting_number = 1
+        while starting_number is not None:
+            payload = self.tile_search_payload(dataset, latitude, longitude, start_date, end_date, starting_number)
+            scenes = self.send_request("scene-search", payload, self.api_key)
+            results.extend(scenes['results'])
+            starting_number = self.next_page(scenes)
+        return results
+
+    def search_tiles(self, dataset, tiles, latitude=None, longitude=None):
+        # Scenes of the given WRS-2 tiles from the local catalog. Only date ranges the
+        # catalog has not searched yet go to M2M, around each tile's center, or around
+        # the given point (which lies in every tile) without the WRS-2 index.
+        index = wrs_index()
+        for path, row in tiles:
+            missing = self.catalog.missing_intervals(dataset, path, row, self.start_date, self.end_date)
+            count_cache("scene-catalog", not missing)
+            for start_date, end_date in missing:
+                center = index.center(path, row) if index is not None else (latitude, longitude)
+                scenes = self.search_tile(dataset, *center, start_date, end_date)
+                self.catalog.add_scenes(dataset, path, row, start_date, end_date, scenes)
+        return self.catalog.scenes(dataset, tiles, self.start_date, self.end_date, self.cloud_cover, self.num_scenes)
+
+    def search_point(self, dataset, latitude, longitude):
+        # Without the WRS-2 index: search around the point once and file the results.
+        scenes = self.search_tile(dataset, latitude, longitude, self.start_date, self.end_date)
+        return self.add_point_scenes(dataset, latitude, longitude, scenes)
+
+    def add_point_scenes(self, dataset, latitude, longitude, scenes):
+        # Files a search around a point under the path/rows in the display ids. Those
+        # tiles are remembered for the point when the search spans a full revisit cycle,
+        # so every tile there has shown up.
+        by_tile = {}
+        for scene in scenes:
+            by_tile.setdefault(parse_display_id(scene['displayId'])[:2], []).append(scene)
+        for (path, row), tile_scenes in by_tile.items():
+            self.catalog.add_scenes(dataset, path, row, self.start_date, self.end_date, tile_scenes)
+        if (date.fromisoformat(self.end_date) - date.fromisoformat(self.start_date)).days >= REPEAT_DAYS:
+            self.catalog.set_tiles_at(latitude, longitude, by_tile)
+        return self.catalog.scenes(dataset, by_tile, self.start_date, self.end_date, self.cloud_cover,
+                                   self.num_scenes)
+
+    def catalog_dataset_alias(self, latitude, longitude):
+        alias = self.catalog.dataset_alias(self.dataset_name)
+        if alias is None:
+            alias = next((dataset['datasetAlias'] for dataset in self.search_datasets(latitude, longitude)
+                          if dataset['datasetAlias'] == 'landsat_ot_c2_l1'), None)
+            if alias is not None:
+                self.catalog.set_dataset_alias(self.dataset_name, alias)
+        return alias
+
+    def find_scenes(self, latitude, longitude):
+        index = wrs_index()
+        if self.catalog is not None:
+            tiles = index.lookup(latitude, longitude) if index is not None \
+                else self.catalog.tiles_at(latitude, longitude)
+            if tiles or index is None:
+                alias = self.catalog_dataset_alias(latitude, longitude)
+                if alias is None:
+                    return None, []
+                if index is None:
+                    count_cache("scene-location", bool(tiles))
+                if tiles:
+                    scenes = self.search_tiles(alias, tiles, latitude, longitude)
+                else:
+                    scenes = self.search_point(alias, latitude, longitude)
+                return (alias, scenes) if scenes else (None, [])
+
         datasets = self.search_datasets(latitude, longitude)
         for dataset in datasets:
             if dataset['datasetAlias'] != 'landsat_ot_c2_l1':
                 continue
             scenes = self.search_scenes(dataset['datasetAlias'], latitude, longitude)
             if scenes['recordsReturned'] > 0:
-                scene_ids = [result['entityId'] for result in scenes['results']]
-
-                payload = {
-                    'datasetName': dataset['datasetAlias'],
-                    'entityIds': scene_ids,
-                    "includeSecondaryFileGroups": False
-                }
-                download_options = self.send_request("download-options", payload, self.api_key)
-                
-                downloads = [{'entityId': product['entityId'], 'productId': product['id']}
-                             for product in download_options
-                             if (product['available'] and product['downloadName'] and 'Full Resolution Browse (Reflective Color) JPEG'
-                                 in product['downloadName'])]
-                if downloads:
-                    payload = {'downloads': downloads, 'label': self.label}
-                    request_results = self.send_request("download-request", payload, self.api_key)
-                    for download in request_results['availableDownloads']:
-                        img = self.get_image_data(download['url'])
-                        if img:
-                            processed_img = self.process_image(img)
-                            if processed_img:
-                                return processed_img
-        return None
+                return dataset['datasetAlias'], scenes['results']
+        return None, []
+
+    def cached_download_options(self, dataset_alias, scene_ids):
+        # Download options the catalog already has, and the scene ids still to ask M2M about.
+        cached = self.catalog.download_options(dataset_alias, scene_ids) if self.catalog is not None else {}
+        download_options = [product for scene_id in scene_ids for product in cached.get(scene_id, [])]
+        missing = [scene_id for scene_id in scene_ids if scene_id not in cached]
+        count_cache("download-options", not missing)
+        return download_options, missing
+
+    def download_options_payload(self, dataset_alias, scene_ids):
+        return {
+            'datasetName': dataset_alias,
+            'entityIds': scene_ids,
+            "includeSecondaryFileGroups": False
+        }
+
+    def add_download_options(self, dataset_alias, scene_ids, download_options, fetched):
+        if self.catalog is not None:
+            self.catalog.set_download_options(dataset_alias, fetched)
+        download_options.extend(fetched)
+        order = {scene_id: i for i, scene_id in enumerate(scene_ids)}
+        download_options.sort(key=lambda product: order.get(product['entityId'], len(order)))
+
+    @staticmethod
+    def browse_downloads(download_options):
+        return [{'entityId': product['entityId'], 'productId': product['id']}
+                for product in download_options
+                if (product['available'] and product['downloadName'] and 'Full Resolution Browse (Reflective Color) JPEG'
+                    in product['downloadName'])]
+
+    @staticmethod
+    def label_downloads(downloads, available):
+        if len(downloads) == 1:
+            for download in available:
+                download.setdefault('entityId', downloads[0]['entityId'])
+        return available
+
+    def request_downloads(self, dataset_alias, scene_ids):
+        download_options, missing = self.cached_download_options(dataset_alias, scene_ids)
+        if missing:
+            fetched = self.send_request("download-options", self.download_options_payload(dataset_alias, missing), self.api_key)
+            self.add_download_options(dataset_alias, scene_ids, download_options, fetched)
 
-    def get_image_data(self, url):
+        downloads = self.browse_downloads(download_options)
+        if not downloads:
+            return []
+        payload = {'downloads': downloads, 'label': self.label}
+        request_results = self.send_request("download-request", payload, self.api_key)
+        return self.label_downloads(downloads, request_results['availableDownloads'])
+
+    def get_processed_scene(self, dataset_alias, scene_ids):
+        scenes = self.iter_processed_scenes(dataset_alias, scene_ids, ranked_first=True)
+        try:
+            return next(scenes, (None, None))
+        finally:
+            scenes.close()
+
+    def process_download(self, spool, error):
+        if error is not None:
+            print(f"Failed to retrieve image: {error}")
+            return None
+        img = self.decode_image(spool)
+        if not img:
+            return None
+        with stage("process"):
+            return self.process_image(img)
+
+    def iter_processed_scenes(self, dataset_alias, scene_ids, ranked_first=False):
+        # Yields (entityId, processed image) in the order the downloads finish. With
+        # ranked_first, the first one is the best-ranked scene that processes: downloads
+        # still run in parallel, but each scene is only tried once every better-ranked one
+        # has arrived, and later ones wait as spools until the first has been found.
+        downloads = self.request_downloads(dataset_alias, scene_ids)
+        http = self.session.http if self.session is not None else requests
+        held = {}
+        next_index = 0 if ranked_first else len(downloads)
+        fetched = download_pool.fetch(http, [download['url'] for download in downloads])
         try:
-            response = requests.get(url, stream=True, timeout=60)
-            response.raise_for_status()
-            return Image.open(io.BytesIO(response.content))
-        except requests.exceptions.RequestException as e:
-            raise RuntimeError(f"Failed to retrieve image: {e}")
+            for index, spool, error in fetched:
+                if next_index >= len(downloads):
+                    processed_img = self.process_download(spool, error)
+                    if processed_img:
+                        yield downloads[index].get('entityId'), processed_img
+                    del processed_img
+                    continue
+                held[index] = (spool, error)
+                while next_index in held:
+                    download = downloads[next_index]
+                    processed_img = self.process_download(*held.pop(next_index))
+                    next_index += 1
+                    if not processed_img:
+                        continue
+                    yield download.get('entityId'), processed_img
+                    del processed_img
+                    # Found; everything that arrived meanwhile follows in arrival order.
+                    next_index = len(downloads)
+                    for held_index in list(held):
+                        processed_img = self.process_download(*held.pop(held_index))
+                        if processed_img:
+                            yield downloads[held_index].get('entityId'), processed_img
+                        del processed_img
+        finally:
+            fetched.close()
+            for spool, _ in held.values():
+                if spool is not None:
+                    spool.close()
+
+    def get_composite(self, dataset_alias, scenes, method='median'):
+        # Scenes are ranked by cloud cover; the best one that processes defines the output
+        # footprint and size.
+        scenes = sorted(scenes, key=cloud_cover)
+        ranks = {scene['entityId']: rank for rank, scene in enumerate(scenes)}
+        bounds = {scene['entityId']: bounds_from_geometry(scene.get('spatialBounds') or scene.get('spatialCoverage') or {})
+                  for scene in scenes}
+
+        stack = None
+        reference_bounds = None
+        stacked_ranks = []
+        try:
+            for entity_id, img in self.iter_processed_scenes(dataset_alias, [scene['entityId'] for scene in scenes],
+                                                             ranked_first=True):
+                if stack is None:
+                    stack = SceneStack(len(scenes), img.size, DOWNLOAD_SPOOL_DIR)
+                    reference_bounds = bounds.get(entity_id)
+                stack.add(align(img, bounds.get(entity_id), reference_bounds, stack.size))
+                stacked_ranks.append(ranks.get(entity_id, len(scenes)))
+                del img
+            if stack is None:
+                return None
+            with stage("composite"):
+                return composite(stack.array[:stack.count], method, stacked_ranks, COMPOSITE_STRIP_BYTES)
+        finally:
+            if stack is not None:
+                stack.close()
+
+    def decode_image(self, spool):
+        try:
+            with stage("decode"):
+                img = Image.open(spool)
+                # Image.open only reads the header, so oversized images are rejected before
+                # anything is decoded. Decoded source plus the RGBA copy made by process_image.
+                width, height = img.size
+                needed = width * height * (len(img.getbands()) + 4)
+                if needed > MAX_IMAGE_BYTES:
+                    raise MemoryError(f"{width}x{height} image needs {needed} bytes, limit is {MAX_IMAGE_BYTES}")
+                img.load()
+            return img
+        except Exception as e:
+            print(f"Failed to decode image: {e}")
+            return None
+        finally:
+            spool.close()
 
     def process_image(self, img):
         try:
+            width, height = img.size
             img = img.convert("RGBA")
-            data = np.array(img)
-            red, green, blue, alpha = data[..., 0], data[..., 1], data[..., 2], data[..., 3]
-            black_mask = (red == 0) & (green == 0) & (blue == 0)
-            data[black_mask] = [0, 0, 0, 0]
-            return Image.fromarray(data)
+            # Black pixels already have zero RGB, so only the alpha band changes.
+            # Build it strip by strip instead of copying the whole image into NumPy.
+            alpha = np.empty((height, width), dtype=np.uint8)
+            rows = max(1, PROCESS_STRIP_BYTES // (width * 4))
+            for top in range(0, height, rows):
+                bottom = min(top + rows, height)
+                # View each RGBA pixel as one little-endian word: RGB is the low 24 bits.
+                pixels = np.asarray(img.crop((0, top, width, bottom))).view("<u4")[..., 0]
+                alpha[top:bottom] = np.where(pixels & 0xFFFFFF, pixels >> 24, 0)
+            img.putalpha(Image.fromarray(alpha, "L"))
+            return img
         except Exception as e:
             print(f"Failed to process image: {e}")
             return None
 
     def logout(self):
+        if self.session is not None:
+            # The shared session stays logged in for the next request.
+            return
         self.send_request("logout", {}, self.api_key)
         print("Logged out.")
 
 
+def scene_image_key(entity_id, encoding=DEFAULT_ENCODING):
+    return image_cache.key(entity_id, processing=PROCESSING_VERSION, **variant_params(encoding))
+
+
+def write_master(entity_id, img):
+    try:
+        with stage("encode-master"):
+            master, _, _ = encode_image(img, DEFAULT_ENCODING)
+        image_cache.put(scene_image_key(entity_id), master)
+    except Exception as e:
+        print(f"Error caching full-resolution image: {e}")
+    finally:
+        with master_lock:
+            pending_masters.discard(entity_id)
+
+
+def cache_master_later(entity_id, img):
+    # The full-resolution PNG that later variants, tiles and /scene start from. Encoding
+    # it can take several times longer than a preview, so it is written after the
+    # response. Past MASTER_QUEUE_SIZE pending images it is skipped; a later request for
+    # the scene downloads it again.
+    with master_lock:
+        if entity_id in pending_masters or len(pending_masters) >= MASTER_QUEUE_SIZE:
+            return
+        if image_cache.contains(scene_image_key(entity_id)):
+            return
+        pending_masters.add(entity_id)
+    master_writer.submit(write_master, entity_id, img)
+
+
+def encode_scene(entity_id, img, encoding, cache_master=True):
+    # Returns (data, mimetype, cache key); scenes without an id are not cached.
+    with stage("encode"):
+        data, ext, mimetype = encode_image(img, encoding)
+    if entity_id is None:
+        return data, mimetype, None
+    key = scene_image_key(entity_id, encoding)
+    image_cache.put(key, data, ext)
+    if cache_master and variant_params(encoding):
+        cache_master_later(entity_id, img)
+    return data, mimetype, key
+
+
+def send_scene(entity_id, img, encoding, cache_master=True):
+    data, mimetype, key = encode_scene(entity_id, img, encoding, cache_master)
+    if key is None:
+        return send_file(io.BytesIO(data), mimetype=mimetype)
+    return send_file(io.BytesIO(data), mimetype=mimetype, etag=key, conditional=True)
+
+
+def send_cached_scene(entity_id, encoding):
+    ext, mimetype = FORMATS[encoding["format"]]
+    key = scene_image_key(entity_id, encoding)
+    cached = image_cache.open(key, ext)
+    count_cache("image", cached is not None)
+    if cached is not None:
+        return send_file(cached, mimetype=mimetype, etag=key, conditional=True)
+    if variant_params(encoding):
+        # Re-encode from the cached full-resolution PNG instead of downloading again.
+        master = image_cache.open(scene_image_key(entity_id))
+        count_cache("image-master", master is not None)
+        if master is not None:
+            with master:
+                img = Image.open(master)
+                img.load()
+            return send_scene(entity_id, img, encoding, cache_master=False)
+    return None
+
+
+def send_composite(downloader, dataset_alias, scenes, method, encoding):
+    if not scenes:
+        return jsonify({"error": "Failed to retrieve image."}), 500
+    # Cached like a scene, under an id made from the method and the scenes it combines.
+    composite_id = f"composite:{method}:{','.join(sorted(scene['entityId'] for scene in scenes))}"
+    response = send_cached_scene(composite_id, encoding)
+    if response is None:
+        img = downloader.get_composite(dataset_alias, scenes, method)
+        if img is None:
+            return jsonify({"error": "Failed to retrieve image."}), 500
+        response = send_scene(composite_id, img, encoding)
+    if request.args.get('format') == 'auto':
+        response.vary.add('Accept')
+    return response
+
+
+def make_downloader(args):
+    return LandsatDownloader(username=Config.USERNAME,
+                             token=Config.TOKEN, path=None,
+                             start_date=args.get('start_date', '2024-09-01'),
+                             end_date=args.get('end_date', datetime.now().strftime('%Y-%m-%d')),
+                             num_scenes=int(args.get('num_scenes', 1)),
+                             cloud_cover=int(args.get('cloud_cover', 30)),
+                             session=get_m2m_session(),
+                             catalog=scene_catalog)
+
+
 @app.route('/get_landsat_data', methods=['GET'])
 def get_landsat_image():
-    username = Config.USERNAME
-    token = Config.TOKEN
-    start_date = request.args.get('start_date', '2024-09-01')
-    end_date = request.args.get('end_date', datetime.now().strftime('%Y-%m-%d'))
-    num_scenes = int(request.args.get('num_scenes', 1))
-    cloud_cover = int(request.args.get('cloud_cover', 30))
     latitude = float(request.args.get('latitude', 23.8041))
     longitude = float(request.args.get('longitude', 90.4152))
     
-    if not username or not token:
+    if not Config.USERNAME or not Config.TOKEN:
         return jsonify({"error": "Username and token are required."}), 400
+    try:
+        encoding = parse_encoding(request.args, request.headers.get('Accept', ''))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    method = request.args.get('composite')
+    if method is not None and method not in COMPOSITE_METHODS:
+        return jsonify({"error": f"Composite must be one of {', '.join(COMPOSITE_METHODS)}."}), 400
 
-    downloader = LandsatDownloader(username=username, 
-                                   token=token, path=None, 
-                                   start_date=start_date, 
-                                   end_date=end_date, 
-                                   num_scenes=num_scenes, 
-                                   cloud_cover=cloud_cover)
+    downloader = make_downloader(request.args)
     try:
-        downloader.login()
-        processed_img = downloader.get_processed_image(latitude, longitude)
-        if processed_img:
-            img_io = io.BytesIO()
-            processed_img.save(img_io, 'PNG')
-            img_io.seek(0)
-            return send_file(img_io, mimetype='image/png')
-        else:
+        dataset_alias, scenes = downloader.find_scenes(latitude, longitude)
+        if method is not None:
+            return send_composite(downloader, dataset_alias, scenes, method, encoding)
+        # Only the first scene in search order, the one a download would pick, is served
+        # from the cache; otherwise the answer would depend on which scenes are cached.
+        response = send_cached_scene(scenes[0]['entityId'], encoding) if scenes else None
+        if response is None and scenes:
+            entity_id, processed_img = downloader.get_processed_scene(dataset_alias, [scene['entityId'] for scene in scenes])
+            if processed_img:
+                response = send_scene(entity_id, processed_img, encoding)
+        if response is None:
             return jsonify({"error": "Failed to retrieve image."}), 500
+        if request.args.get('format') == 'auto':
+            response.vary.add('Accept')
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def resolve_scene(downloader, latitude, longitude):
+    dataset_alias, scenes = downloader.find_scenes(latitude, longitude)
+    scene = scenes[0] if scenes and image_cache.contains(scene_image_key(scenes[0]['entityId'])) else None
+    count_cache("image", scene is not None)
+    if scene is None and scenes:
+        entity_id, processed_img = downloader.get_processed_scene(dataset_alias, [scene['entityId'] for scene in scenes])
+        if processed_img and entity_id is not None:
+            with stage("encode"):
+                data = encode_image(processed_img, DEFAULT_ENCODING)[0]
+            image_cache.put(scene_image_key(entity_id), data)
+            scene = next((scene for scene in scenes if scene['entityId'] == entity_id), None)
+    if scene is None:
+        raise RuntimeError("Failed to retrieve image.")
+
+    key = scene_image_key(scene['entityId'])
+    bounds = tile_pyramid.load_bounds(key)
+    if bounds is None:
+        bounds = bounds_from_geometry(scene.get('spatialBounds') or scene.get('spatialCoverage') or {})
+        if bounds is None:
+            raise RuntimeError("Scene has no spatial bounds.")
+        tile_pyramid.save_bounds(key, bounds)
+    return {
+        "scene": scene['entityId'],
+        "bounds": [[bounds[0], bounds[1]], [bounds[2], bounds[3]]],
+        "tiles": f"/tiles/{scene['entityId']}/{{z}}/{{x}}/{{y}}.png",
+        "image": f"/scene/{scene['entityId']}/image",
+        "maxzoom": tile_pyramid.max_zoom(key, bounds),
+    }
+
+
+@app.route('/scene', methods=['GET'])
+def get_scene_tiles():
+    latitude = float(request.args.get('latitude', 23.8041))
+    longitude = float(request.args.get('longitude', 90.4152))
+
+    if not Config.USERNAME or not Config.TOKEN:
+        return jsonify({"error": "Username and token are required."}), 400
+
+    downloader = make_downloader(request.args)
+    try:
+        return jsonify(resolve_scene(downloader, latitude, longitude))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@app.route('/scene/<scene>/image', methods=['GET'])
+def get_scene_image(scene):
+    try:
+        encoding = parse_encoding(request.args, request.headers.get('Accept', ''))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = send_cached_scene(scene, encoding)
+    if response is None:
+        return jsonify({"error": "Scene image is not cached."}), 404
+    if request.args.get('format') == 'auto':
+        response.vary.add('Accept')
+    return response
+
+
+def scene_job_key(downloader, latitude, longitude):
+    # Points in the same WRS-2 cell find the same scenes, so they share one job.
+    index = wrs_index()
+    location = tuple(index.lookup(latitude, longitude)) if index is not None else ()
+    if not location:
+        location = (round(latitude, 2), round(longitude, 2))
+    return (location, downloader.start_date, downloader.end_date, downloader.num_scenes, downloader.cloud_cover)
+
+
+def job_response(job):
+    response = job.to_dict()
+    response["status_url"] = f"/jobs/{job.id}"
+    return response
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_scene_job():
+    args = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+    if not Config.USERNAME or not Config.TOKEN:
+        return jsonify({"error": "Username and token are required."}), 400
+    try:
+        latitude, longitude = parse_point((args.get('latitude', 23.8041), args.get('longitude', 90.4152)))
+        downloader = make_downloader(args)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid scene parameters."}), 400
+
+    job, created = scene_jobs.submit(scene_job_key(downloader, latitude, longitude),
+                                     resolve_scene, downloader, latitude, longitude)
+    return jsonify(job_response(job)), 202 if created else 200
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_scene_job(job_id):
+    try:
+        wait = min(float(request.args.get('wait', 0)), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "Wait must be a number of seconds."}), 400
+    # A waiting poll holds a server thread, so only JOB_MAX_WAITERS of them wait at once.
+    waiting = wait > 0 and job_waiters.acquire(blocking=False)
+    try:
+        job = scene_jobs.wait(job_id, wait) if waiting else scene_jobs.get(job_id)
     finally:
-        downloader.logout()
+        if waiting:
+            job_waiters.release()
+    if job is None:
+        return jsonify({"error": "Unknown or expired job."}), 404
+    response = job_response(job)
+    if wait > 0 and not waiting and job.status not in ("done", "failed"):
+        response["retry_after"] = JOB_RETRY_AFTER
+    return jsonify(response)
+
+
+@app.route('/tiles/<scene>/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def get_scene_tile(scene, z, x, y):
+    if z > 22 or x >= 2 ** z or y >= 2 ** z:
+        return jsonify({"error": "Tile out of range."}), 400
+    key = scene_image_key(scene)
+    bounds = tile_pyramid.load_bounds(key)
+    if bounds is None:
+        return jsonify({"error": "Unknown scene. Request it through /scene first."}), 404
+    data = tile_pyramid.render(key, bounds, z, x, y)
+    if data is None:
+        return jsonify({"error": "Scene image is no longer cached."}), 404
+    return send_file(io.BytesIO(data), mimetype='image/png', etag=f"{key}-{z}-{x}-{y}", conditional=True, max_age=86400)
+
+
+band_reader = BandReader(BANDS_ROOT) if rasterio is not None else None
+
+
+def parse_product(args):
+    product_id = args.get('product')
+    if not product_id or '/' in product_id or '..' in product_id:
+        raise ValueError("A valid product ID is required.")
+    return product_id
+
+
+def parse_band_window(args):
+    product_id = parse_product(args)
+    latitude, longitude = parse_point((args.get('latitude'), args.get('longitude')))
+    radius = float(args.get('radius', 5000))
+    size = int(args.get('size', 1024))
+    if not 0 < radius <= BAND_MAX_RADIUS:
+        raise ValueError(f"Radius must be between 0 and {BAND_MAX_RADIUS} meters.")
+    if not 0 < size <= BAND_MAX_SIZE:
+        raise ValueError(f"Size must be between 1 and {BAND_MAX_SIZE} pixels.")
+    return product_id, latitude, longitude, radius, size
+
+
+@app.route('/bands/image', methods=['GET'])
+def get_band_image():
+    if band_reader is None:
+        return jsonify({"error": "GeoTIFF band access requires rasterio."}), 503
+    try:
+        product_id, latitude, longitude, radius, size = parse_band_window(request.args)
+        bands = request.args.get('bands', 'red,green,blue').split(',')
+        if len(bands) not in (1, 3) or any(band not in BANDS for band in bands):
+            raise ValueError(f"Bands must be one or three of {', '.join(BANDS)}.")
+        encoding = parse_encoding(request.args, request.headers.get('Accept', ''))
+    except (TypeError, ValueError, IndexError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    window_id = image_cache.key(product_id, bands=bands, latitude=latitude, longitude=longitude,
+                                radius=radius, size=size)
+    response = send_cached_scene(window_id, encoding)
+    if response is None:
+        try:
+            img = band_reader.render(product_id, bands, latitude, longitude, radius, size)
+        except rasterio.errors.RasterioIOError as e:
+            return jsonify({"error": f"Band not available: {e}"}), 404
+        if img is None:
+            return jsonify({"error": "Location is outside the scene."}), 404
+        response = send_scene(window_id, img, encoding)
+    if request.args.get('format') == 'auto':
+        response.vary.add('Accept')
+    return response
+
+
+@app.route('/indices/<name>', methods=['GET'])
+def get_spectral_index(name):
+    if band_reader is None:
+        return jsonify({"error": "GeoTIFF band access requires rasterio."}), 503
+    if name not in INDICES:
+        return jsonify({"error": f"Index must be one of {', '.join(INDICES)}."}), 404
+    fmt = request.args.get('format', 'png')
+    if fmt not in ('png', 'tiff'):
+        return jsonify({"error": "Format must be png or tiff."}), 400
+    try:
+        if request.args.get('latitude') is None:
+            # The whole scene; raw GeoTIFFs default to full resolution.
+            product_id = parse_product(request.args)
+            latitude = longitude = radius = None
+            size = int(request.args['size']) if 'size' in request.args else (None if fmt == 'tiff' else 1024)
+        else:
+            product_id, latitude, longitude, radius, size = parse_band_window(request.args)
+        if size is not None and not 0 < size <= BAND_MAX_SIZE:
+            raise ValueError(f"Size must be between 1 and {BAND_MAX_SIZE} pixels.")
+        index = SpectralIndex(band_reader, product_id, name, latitude, longitude, radius, size, INDEX_BLOCK_SIZE)
+    except (TypeError, ValueError, IndexError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    ext = 'tif' if fmt == 'tiff' else 'png'
+    key = image_cache.key(product_id, index=name, latitude=latitude, longitude=longitude,
+                          radius=radius, size=size, format=fmt)
+    mimetype = 'image/tiff' if fmt == 'tiff' else 'image/png'
+    cached = image_cache.open(key, ext)
+    if cached is not None:
+        return send_file(cached, mimetype=mimetype, etag=key, conditional=True)
+
+    try:
+        with index:
+            if index.window is None:
+                return jsonify({"error": "Location is outside the scene."}), 404
+            if fmt == 'tiff':
+                fd, tmp = tempfile.mkstemp(suffix='.tif', dir=image_cache.directory)
+                os.close(fd)
+                try:
+                    index.write_geotiff(tmp)
+                    path = image_cache.put_file(key, tmp, ext)
+                except BaseException:
+                    if os.path.exists(tmp):
+                        os.unlink(tmp)
+                    raise
+                return send_file(path, mimetype=mimetype, etag=key, conditional=True)
+            data, _, _ = encode_image(index.render(), DEFAULT_ENCODING)
+    except rasterio.errors.RasterioIOError as e:
+        return jsonify({"error": f"Band not available: {e}"}), 404
+    image_cache.put(key, data, ext)
+    return send_file(io.BytesIO(data), mimetype=mimetype, etag=key, conditional=True)
+
+
+SAMPLE_DATASET = "landsat_ot_c2_l2"
+sample_cache_lock = threading.Lock()
+
+
+def group_points_by_tile(points):
+    # (path, row) -> (search point, indices of the points inside the tile). Without the
+    # index every point is searched on its own, under a path/row of None.
+    index = wrs_index()
+    groups = {}
+    for i, point in enumerate(points):
+        tiles = index.lookup(*point) if index is not None else []
+        for path, row in tiles:
+            groups.setdefault((path, row), (index.center(path, row), []))[1].append(i)
+        if not tiles:
+            groups.setdefault((None, point), (point, []))[1].append(i)
+    return groups
+
+
+def group_points_by_scene(downloader, points):
+    # displayId -> (scene, indices of the points it was found for), so each scene is
+    # sampled once for all of its points even when they had to be searched one by one.
+    groups = {}
+    for (path, row), (center, members) in group_points_by_tile(points).items():
+        if path is not None:
+            scenes = downloader.search_tiles(SAMPLE_DATASET, [(path, row)])
+        else:
+            tiles = downloader.catalog.tiles_at(*center)
+            scenes = downloader.search_tiles(SAMPLE_DATASET, tiles, *center) if tiles \
+                else downloader.search_point(SAMPLE_DATASET, *center)
+        for scene in scenes:
+            # A dict as an ordered set: a point in two overlapping tiles is sampled once.
+            groups.setdefault(scene['displayId'], (scene, {}))[1].update(dict.fromkeys(members))
+    return {display_id: (scene, list(members)) for display_id, (scene, members) in groups.items()}
+
+
+def load_samples(key):
+    cached = image_cache.open(key, "json")
+    if cached is None:
+        return {}
+    with cached:
+        return json.load(cached)
+
+
+def sample_scene(product_id, bands, points):
+    # Sampled values are cached per product, keyed by point and band.
+    key = image_cache.key(product_id, samples=True)
+    with sample_cache_lock:
+        samples = load_samples(key)
+    point_keys = [f"{latitude:.6f},{longitude:.6f}" for latitude, longitude in points]
+    missing = sorted({i for i, point_key in enumerate(point_keys)
+                      for band in bands if band not in samples.get(point_key, {})})
+    if missing:
+        values = band_reader.sample(product_id, bands, [points[i] for i in missing])
+        with sample_cache_lock:
+            samples = {**load_samples(key), **samples}
+            for i, row in zip(missing, values):
+                samples.setdefault(point_keys[i], {}).update(
+                    {band: None if np.isnan(value) else round(float(value), 6) for band, value in zip(bands, row)})
+            image_cache.put(key, json.dumps(samples).encode(), "json")
+    return [{band: samples[point_key].get(band) for band in bands} for point_key in point_keys]
+
+
+@app.route('/samples', methods=['POST'])
+def sample_points():
+    if band_reader is None:
+        return jsonify({"error": "GeoTIFF band access requires rasterio."}), 503
+    if not Config.USERNAME or not Config.TOKEN:
+        return jsonify({"error": "Username and token are required."}), 400
+    body = request.get_json(silent=True) or {}
+    try:
+        points = body.get("points")
+        if not isinstance(points, list) or not 0 < len(points) <= MAX_SAMPLE_POINTS:
+            raise ValueError(f"Points must be a list of at most {MAX_SAMPLE_POINTS} points.")
+        points = [parse_point(point) for point in points]
+        bands = body.get("bands", ["blue", "green", "red", "nir", "swir1", "swir2"])
+        if not isinstance(bands, list) or not bands or any(band not in BANDS for band in bands):
+            raise ValueError(f"Bands must be a list of {', '.join(BANDS)}.")
+        downloader = make_downloader({**body, 'num_scenes': min(int(body.get('num_scenes', MAX_SAMPLE_SCENES)), MAX_SAMPLE_SCENES)})
+    except (TypeError, ValueError, IndexError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = [{"latitude": latitude, "longitude": longitude, "samples": []} for latitude, longitude in points]
+    try:
+        # One scene search per WRS-2 tile (or per point without the index), and one read
+        # of each scene for all of its points.
+        for display_id, (scene, members) in group_points_by_scene(downloader, points).items():
+            try:
+                values = sample_scene(display_id, bands, [points[i] for i in members])
+            except rasterio.errors.RasterioIOError as e:
+                print(f"Failed to sample {display_id}: {e}")
+                continue
+            for i, point_values in zip(members, values):
+                if all(value is None for value in point_values.values()):
+                    continue
+                results[i]["samples"].append({
+                    "scene": display_id,
+                    "entityId": scene['entityId'],
+                    "date": parse_display_id(display_id)[2],
+                    "cloud_cover": scene.get('cloudCover'),
+                    "values": point_values,
+                })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    for result in results:
+        result["samples"].sort(key=lambda sample: sample["date"])
+    return jsonify({"results": results})
+
 
 @app.route('/latitude', methods=['GET'])
 def get_latitude():
+    landsat_8_tle = tle_store.get(LANDSAT_8)
+    if landsat_8_tle is None:
+        return {"error": "TLE data unavailable."}, 503
     return jsonify({"latitude": landsat_8_tle[0]})
 
 @app.route('/longitude', methods=['GET'])
 def get_longitude():
+    landsat_9_tle = tle_store.get(LANDSAT_9)
+    if landsat_9_tle is None:
+        return {"error": "TLE data unavailable."}, 503
     return jsonify({"longitude": landsat_9_tle[0]})
 
+def warmup():
+    # Loads the read-only state every worker needs. A pre-forking server calls this
+    # before it forks (see wsgi.py), so workers share it copy-on-write instead of each
+    # loading a copy on its first requests.
+    get_all_satellite_data()
+    acquisition_schedule.index()
+    wrs_index()
+    static_files.files()
+    Image.init()
+    # The collector writes to every object it visits, which would un-share their pages
+    # in each worker; what exists now lives for the whole process anyway.
+    gc.collect()
+    gc.freeze()
+
+
+def after_fork():
+    # Workers get their own connections, locks and background threads instead of the
+    # parent's.
+    global m2m_session, m2m_session_lock, job_waiters, master_writer, master_lock, pending_masters
+    m2m_session = None
+    m2m_session_lock = threading.Lock()
+    master_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="master")
+    master_lock = threading.Lock()
+    pending_masters = set()
+    atexit.register(master_writer.shutdown)
+    job_waiters = threading.BoundedSemaphore(JOB_MAX_WAITERS)
+    for component in (tle_store, acquisition_schedule, scene_catalog, scene_jobs, reminder_store,
+                      reminder_scheduler, image_cache, registry, metrics_writer):
+        component.after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=after_fork)
+
+
 if __name__ == '__main__':
     try:
         # # Step 1: Change directory to the client folder
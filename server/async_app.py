@@ -0,0 +1,300 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from app import (Config, DOWNLOAD_READ_TIMEOUT, DOWNLOAD_SPOOL_BYTES, DOWNLOAD_SPOOL_DIR, DOWNLOAD_TIMEOUT,
+                 M2M_SERVICE_URL, M2M_TOKEN_TTL, STREAM_INTERVAL, STREAM_QUEUE_SIZE, LandsatDownloader, encode_scene,
+                 get_all_satellite_data, image_cache, scene_catalog, scene_image_key, wrs_index)
+from async_m2m import AsyncM2MSession, aiohttp, download_to_spool
+from encoding import FORMATS, parse_encoding, variant_params
+from metrics import REQUEST_SECONDS, count_cache, end_request, registry, start_request
+from stream import AsyncPositionBroadcaster
+
+ASYNC_PORT = getattr(Config, "ASYNC_PORT", 5001)
+ASYNC_CONNECTION_LIMIT = getattr(Config, "ASYNC_CONNECTION_LIMIT", 100)
+ASYNC_CONNECTION_LIMIT_PER_HOST = getattr(Config, "ASYNC_CONNECTION_LIMIT_PER_HOST", 20)
+ASYNC_PROCESS_WORKERS = getattr(Config, "ASYNC_PROCESS_WORKERS", os.cpu_count() or 4)
+
+if aiohttp is not None:
+    from aiohttp import web
+
+
+async def run_in_executor(executor, fn, *args):
+    # Keeps the request's context, so stages timed in the worker thread count for it.
+    return await asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run, fn, *args)
+
+
+def close_result(task):
+    if not task.cancelled() and task.exception() is None:
+        task.result().close()
+
+
+class AsyncLandsatDownloader:
+    # LandsatDownloader's M2M request chain and downloads, awaited on an AsyncM2MSession
+    # so a waiting request holds no thread. It wraps a LandsatDownloader for the search
+    # parameters, payloads and catalog handling, and never calls its blocking M2M methods.
+    # Catalog (SQLite) and WRS-2 lookups run on the default executor; decoding and masking
+    # are CPU-bound and run on executor. Composites are only available on the WSGI app.
+    def __init__(self, session, executor, catalog=None, **kwargs):
+        self.session = session
+        self.executor = executor
+        self.catalog = catalog
+        self.downloader = LandsatDownloader(username=session.username, token=session.token, path=None,
+                                            catalog=catalog, **kwargs)
+
+    async def send_request(self, endpoint, data):
+        return await self.session.send_request(endpoint, data)
+
+    async def search_datasets(self, latitude, longitude):
+        payload = self.downloader.dataset_search_payload(latitude, longitude)
+        datasets = await self.send_request("dataset-search", payload)
+        print(f"Found {len(datasets)} datasets.")
+        return datasets
+
+    async def search_scenes(self, dataset, latitude, longitude):
+        scenes = await self.send_request("scene-search",
+                                         self.downloader.scene_search_payload(dataset, latitude, longitude))
+        print(f"Found {scenes['recordsReturned']} scenes.")
+        return scenes
+
+    async def search_tile(self, dataset, latitude, longitude, start_date, end_date):
+        results = []
+        starting_number = 1
+        while starting_number is not None:
+            payload = self.downloader.tile_search_payload(dataset, latitude, longitude, start_date, end_date,
+                                                          starting_number)
+            scenes = await self.send_request("scene-search", payload)
+            results.extend(scenes['results'])
+            starting_number = self.downloader.next_page(scenes)
+        return results
+
+    async def search_tiles(self, index, dataset, tiles, latitude, longitude):
+        start_date, end_date = self.downloader.start_date, self.downloader.end_date
+        for path, row in tiles:
+            missing = await run_in_executor(None, self.catalog.missing_intervals, dataset, path, row,
+                                            start_date, end_date)
+            count_cache("scene-catalog", not missing)
+            for missing_start, missing_end in missing:
+                center = index.center(path, row) if index is not None else (latitude, longitude)
+                scenes = await self.search_tile(dataset, *center, missing_start, missing_end)
+                await run_in_executor(None, self.catalog.add_scenes, dataset, path, row, missing_start,
+                                      missing_end, scenes)
+        return await run_in_executor(None, self.catalog.scenes, dataset, tiles, start_date, end_date,
+                                     self.downloader.cloud_cover, self.downloader.num_scenes)
+
+    async def search_point(self, dataset, latitude, longitude):
+        scenes = await self.search_tile(dataset, latitude, longitude, self.downloader.start_date,
+                                        self.downloader.end_date)
+        return await run_in_executor(None, self.downloader.add_point_scenes, dataset, latitude, longitude, scenes)
+
+    async def find_scenes(self, latitude, longitude):
+        if self.catalog is not None:
+            # The first call loads the WRS-2 shapefile, so even the index is fetched off the loop.
+            index = await run_in_executor(None, wrs_index)
+            if index is not None:
+                tiles = await run_in_executor(None, index.lookup, latitude, longitude)
+            else:
+                tiles = await run_in_executor(None, self.catalog.tiles_at, latitude, longitude)
+            if tiles or index is None:
+                dataset_name = self.downloader.dataset_name
+                alias = await run_in_executor(None, self.catalog.dataset_alias, dataset_name)
+                if alias is None:
+                    alias = next((dataset['datasetAlias'] for dataset in await self.search_datasets(latitude, longitude)
+                                  if dataset['datasetAlias'] == 'landsat_ot_c2_l1'), None)
+                    if alias is None:
+                        return None, []
+                    await run_in_executor(None, self.catalog.set_dataset_alias, dataset_name, alias)
+                if index is None:
+                    count_cache("scene-location", bool(tiles))
+                if tiles:
+                    scenes = await self.search_tiles(index, alias, tiles, latitude, longitude)
+                else:
+                    scenes = await self.search_point(alias, latitude, longitude)
+                return (alias, scenes) if scenes else (None, [])
+
+        for dataset in await self.search_datasets(latitude, longitude):
+            if dataset['datasetAlias'] != 'landsat_ot_c2_l1':
+                continue
+            scenes = await self.search_scenes(dataset['datasetAlias'], latitude, longitude)
+            if scenes['recordsReturned'] > 0:
+                return dataset['datasetAlias'], scenes['results']
+        return None, []
+
+    async def request_downloads(self, dataset_alias, scene_ids):
+        download_options, missing = await run_in_executor(None, self.downloader.cached_download_options,
+                                                          dataset_alias, scene_ids)
+        if missing:
+            fetched = await self.send_request("download-options",
+                                              self.downloader.download_options_payload(dataset_alias, missing))
+            await run_in_executor(None, self.downloader.add_download_options, dataset_alias, scene_ids,
+                                  download_options, fetched)
+
+        downloads = self.downloader.browse_downloads(download_options)
+        if not downloads:
+            return []
+        request_results = await self.send_request("download-request",
+                                                  {'downloads': downloads, 'label': self.downloader.label})
+        return self.downloader.label_downloads(downloads, request_results['availableDownloads'])
+
+    async def get_processed_scene(self, dataset_alias, scene_ids):
+        # Every download starts at once; scenes are still tried in search order.
+        downloads = await self.request_downloads(dataset_alias, scene_ids)
+        tasks = [asyncio.create_task(download_to_spool(self.session.http, download['url'], DOWNLOAD_TIMEOUT,
+                                                       DOWNLOAD_READ_TIMEOUT, DOWNLOAD_SPOOL_BYTES, DOWNLOAD_SPOOL_DIR))
+                 for download in downloads]
+        consumed = 0
+        try:
+            for download, task in zip(downloads, tasks):
+                try:
+                    spool = await task
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    print(f"Failed to retrieve image: {e}")
+                    continue
+                finally:
+                    consumed += 1
+                processed_img = await run_in_executor(self.executor, self.downloader.process_download, spool, None)
+                if processed_img:
+                    return download.get('entityId'), processed_img
+        finally:
+            for task in tasks[consumed:]:
+                task.cancel()
+                task.add_done_callback(close_result)
+        return None, None
+
+
+def read_cached_scene(entity_id, encoding):
+    # send_cached_scene for the async app: (data, mimetype, key), or None if not cached.
+    ext, mimetype = FORMATS[encoding["format"]]
+    key = scene_image_key(entity_id, encoding)
+    cached = image_cache.open(key, ext)
+    count_cache("image", cached is not None)
+    if cached is not None:
+        with cached:
+            return cached.read(), mimetype, key
+    if variant_params(encoding):
+        master = image_cache.open(scene_image_key(entity_id))
+        count_cache("image-master", master is not None)
+        if master is not None:
+            with master:
+                img = Image.open(master)
+                img.load()
+            return encode_scene(entity_id, img, encoding, cache_master=False)
+    return None
+
+
+def error(message, status):
+    return web.json_response({"error": message}, status=status)
+
+
+async def get_landsat_image(request):
+    args = request.query
+    try:
+        latitude = float(args.get('latitude', 23.8041))
+        longitude = float(args.get('longitude', 90.4152))
+    except ValueError:
+        return error("Latitude and longitude must be numbers.", 400)
+    if not Config.USERNAME or not Config.TOKEN:
+        return error("Username and token are required.", 400)
+    try:
+        encoding = parse_encoding(args, request.headers.get('Accept', ''))
+    except ValueError as e:
+        return error(str(e), 400)
+    if args.get('composite') is not None:
+        return error("Composites are only served by the WSGI app.", 400)
+
+    executor = request.app["executor"]
+    downloader = AsyncLandsatDownloader(request.app["m2m"], executor,
+                                        start_date=args.get('start_date', '2024-09-01'),
+                                        end_date=args.get('end_date'),
+                                        num_scenes=int(args.get('num_scenes', 1)),
+                                        cloud_cover=int(args.get('cloud_cover', 30)),
+                                        catalog=scene_catalog)
+    try:
+        dataset_alias, scenes = await downloader.find_scenes(latitude, longitude)
+        result = await run_in_executor(executor, read_cached_scene, scenes[0]['entityId'], encoding) if scenes else None
+        if result is None and scenes:
+            entity_id, processed_img = await downloader.get_processed_scene(dataset_alias,
+                                                                            [scene['entityId'] for scene in scenes])
+            if processed_img:
+                result = await run_in_executor(executor, encode_scene, entity_id, processed_img, encoding)
+    except Exception as e:
+        return error(str(e), 500)
+    if result is None:
+        return error("Failed to retrieve image.", 500)
+
+    data, mimetype, key = result
+    headers = {"ETag": f'"{key}"'} if key else {}
+    if args.get('format') == 'auto':
+        headers["Vary"] = "Accept"
+    if key and request.headers.get("If-None-Match") == f'"{key}"':
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=data, content_type=mimetype, headers=headers)
+
+
+async def satellite_stream(request):
+    # The Flask stream holds a thread per client; here a client is only a queue.
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                           "X-Accel-Buffering": "no", "Access-Control-Allow-Origin": "*"})
+    await response.prepare(request)
+    positions = request.app["positions"]
+    try:
+        async for message in positions.events(positions.subscribe()):
+            await response.write(message.encode())
+    except ConnectionResetError:
+        pass
+    return response
+
+
+async def get_metrics(request):
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+if aiohttp is not None:
+    @web.middleware
+    async def timing_middleware(request, handler):
+        # Server-Timing, request metrics and CORS, as the Flask app's hooks do.
+        timings, token = start_request()
+        try:
+            response = await handler(request)
+        finally:
+            end_request(token)
+        if not response.prepared:
+            # Streamed responses have already sent their headers.
+            response.headers["Server-Timing"] = timings.header()
+            response.headers["Timing-Allow-Origin"] = "*"
+            response.headers["Access-Control-Allow-Origin"] = "*"
+        route = request.match_info.route.resource
+        endpoint = route.canonical if route is not None else "unmatched"
+        REQUEST_SECONDS.observe(timings.elapsed(), method=request.method, endpoint=endpoint, status=response.status)
+        return response
+
+
+async def shared_clients(application):
+    application["m2m"] = AsyncM2MSession(Config.USERNAME, Config.TOKEN, service_url=M2M_SERVICE_URL,
+                                         limit=ASYNC_CONNECTION_LIMIT, limit_per_host=ASYNC_CONNECTION_LIMIT_PER_HOST,
+                                         token_ttl=M2M_TOKEN_TTL)
+    application["executor"] = ThreadPoolExecutor(max_workers=ASYNC_PROCESS_WORKERS, thread_name_prefix="process")
+    yield
+    await application["m2m"].close()
+    application["executor"].shutdown(wait=False, cancel_futures=True)
+
+
+def create_app():
+    # Also usable as: gunicorn "async_app:create_app()" --worker-class aiohttp.GunicornWebWorker
+    if aiohttp is None:
+        raise ImportError("aiohttp is required for the async app")
+    application = web.Application(middlewares=[timing_middleware])
+    application.cleanup_ctx.append(shared_clients)
+    application["positions"] = AsyncPositionBroadcaster(get_all_satellite_data, interval=STREAM_INTERVAL,
+                                                        queue_size=STREAM_QUEUE_SIZE)
+    application.router.add_get('/get_landsat_data', get_landsat_image)
+    application.router.add_get('/satellite-stream', satellite_stream)
+    application.router.add_get('/metrics', get_metrics)
+    return application
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), port=ASYNC_PORT)
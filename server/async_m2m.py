@@ -0,0 +1,115 @@
+import asyncio
+import json
+import tempfile
+import time
+
+from downloads import CHUNK_SIZE
+from m2m import SERVICE_URL, M2MError
+from metrics import DOWNLOADED_BYTES, stage
+from utils import lazy_import
+
+aiohttp = lazy_import("aiohttp")
+
+
+class AsyncM2MSession:
+    # The asyncio counterpart of M2MSession. One aiohttp session is shared by every
+    # request; the connector caps open connections overall and per host, so a burst of
+    # scene requests queues for a connection instead of flooding USGS.
+    def __init__(self, username, token, service_url=SERVICE_URL, limit=100, limit_per_host=20,
+                 token_ttl=6600, timeout=60):
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for the async downloader")
+        self.username = username
+        self.token = token
+        self.service_url = service_url
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.token_ttl = token_ttl
+        self.timeout = timeout
+
+        self._http = None
+        self._lock = asyncio.Lock()
+        self._api_key = None
+        self._expires_at = 0
+
+    @property
+    def http(self):
+        # Created on first use, since aiohttp sessions belong to the running event loop.
+        if self._http is None:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+            self._http = aiohttp.ClientSession(connector=connector)
+        return self._http
+
+    async def _post(self, endpoint, data, api_key=None):
+        headers = {'X-Auth-Token': api_key} if api_key else {}
+        with stage(endpoint):
+            async with self.http.post(self.service_url + endpoint, data=json.dumps(data), headers=headers,
+                                      timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                body = await response.read()
+                if response.status in (401, 403):
+                    raise M2MError("AUTH_UNAUTHORIZED", f"HTTP {response.status}")
+                response.raise_for_status()
+        DOWNLOADED_BYTES.inc(len(body), source="m2m")
+        output = json.loads(body)
+        if 'errorCode' in output and output['errorCode'] is not None:
+            raise M2MError(output['errorCode'], output.get('errorMessage'))
+        return output['data']
+
+    async def get_api_key(self):
+        async with self._lock:
+            if self._api_key is None or time.monotonic() >= self._expires_at:
+                self._api_key = await self._post("login-token", {'username': self.username, 'token': self.token})
+                self._expires_at = time.monotonic() + self.token_ttl
+                print("API Key obtained.")
+            return self._api_key
+
+    async def invalidate(self, api_key):
+        async with self._lock:
+            if self._api_key == api_key:
+                self._api_key = None
+
+    async def send_request(self, endpoint, data):
+        api_key = await self.get_api_key()
+        try:
+            return await self._post(endpoint, data, api_key)
+        except M2MError as e:
+            if not e.error_code.startswith("AUTH_"):
+                raise
+            await self.invalidate(api_key)
+            return await self._post(endpoint, data, await self.get_api_key())
+
+    async def logout(self):
+        async with self._lock:
+            if self._api_key is None:
+                return
+            try:
+                await self._post("logout", {}, self._api_key)
+                print("Logged out.")
+            finally:
+                self._api_key = None
+
+    async def close(self):
+        try:
+            await self.logout()
+        except (aiohttp.ClientError, asyncio.TimeoutError, M2MError) as e:
+            print(f"Error logging out: {e}")
+        if self._http is not None:
+            await self._http.close()
+
+
+async def download_to_spool(http, url, timeout=300, read_timeout=60, spool_bytes=16 * 1024 ** 2, spool_dir=None):
+    # Same contract as downloads.download_to_spool: a rewound spool the caller must close.
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes, dir=spool_dir)
+    try:
+        with stage("download"):
+            client_timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=10, sock_read=read_timeout)
+            async with http.get(url, timeout=client_timeout) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    spool.write(chunk)
+                    DOWNLOADED_BYTES.inc(len(chunk), source="browse")
+        spool.seek(0)
+        return spool
+    except BaseException:
+        spool.close()
+        raise
@@ -0,0 +1,31 @@
+import hmac
+
+import requests
+
+
+FIREBASE_LOOKUP_URL = "https://identitytoolkit.googleapis.com/v1/accounts:lookup"
+
+
+def bearer_token(header):
+    scheme, _, token = (header or "").partition(" ")
+    token = token.strip()
+    return token if scheme.lower() == "bearer" and token else None
+
+
+def firebase_user_email(id_token, api_key, timeout=10):
+    # The verified email of the signed-in Firebase user an ID token belongs to, or None
+    # if the token is invalid or expired. Firebase Auth checks the token itself.
+    response = requests.post(FIREBASE_LOOKUP_URL, params={"key": api_key}, json={"idToken": id_token},
+                             timeout=timeout)
+    if response.status_code == 400:
+        return None
+    response.raise_for_status()
+    users = response.json().get("users") or []
+    if not users or not users[0].get("emailVerified"):
+        return None
+    return users[0].get("email")
+
+
+def is_admin(header, admin_token):
+    token = bearer_token(header)
+    return bool(admin_token and token) and hmac.compare_digest(token.encode(), admin_token.encode())
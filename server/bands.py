@@ -0,0 +1,160 @@
+import contextlib
+import math
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from utils import lazy_import
+
+# GDAL is slow to load and large, so rasterio is only imported once a band is read.
+rasterio = lazy_import("rasterio")
+warp = lazy_import("rasterio.warp")
+windows = lazy_import("rasterio.windows")
+
+
+# Landsat 8/9 OLI band numbers.
+BANDS = {
+    "coastal": "B1",
+    "blue": "B2",
+    "green": "B3",
+    "red": "B4",
+    "nir": "B5",
+    "swir1": "B6",
+    "swir2": "B7",
+}
+
+# Collection 2 Level-2 surface reflectance scaling; DN 0 is no-data in both levels.
+SR_SCALE = 0.0000275
+SR_OFFSET = -0.2
+NODATA = 0
+
+GDAL_OPTIONS = {
+    # Don't list the remote directory when opening a single band over HTTP.
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".TIF,.tif",
+    "GDAL_HTTP_MULTIRANGE": "YES",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+}
+
+
+def is_level2(product_id):
+    return product_id.split("_")[1].startswith("L2") if "_" in product_id else False
+
+
+def to_reflectance(dn):
+    reflectance = dn.astype(np.float32) * SR_SCALE + SR_OFFSET
+    return np.ma.masked_where(np.ma.getmaskarray(dn) | (np.ma.getdata(dn) == NODATA), reflectance)
+
+
+class BandReader:
+    def __init__(self, root, stretch_size=1024):
+        if rasterio is None:
+            raise ImportError("rasterio is required to read GeoTIFF bands")
+        self.root = root
+        self.stretch_size = stretch_size
+        self._lock = threading.Lock()
+        self._stretches = {}
+
+    def path(self, product_id, band):
+        band = BANDS.get(band, band)
+        name = f"{product_id}_SR_{band}.TIF" if is_level2(product_id) else f"{product_id}_{band}.TIF"
+        if self.root.startswith(("http://", "https://")):
+            return f"/vsicurl/{self.root.rstrip('/')}/{product_id}/{name}"
+        return os.path.join(self.root, product_id, name)
+
+    @contextlib.contextmanager
+    def open(self, product_id, band):
+        with rasterio.Env(**GDAL_OPTIONS), rasterio.open(self.path(product_id, band)) as src:
+            yield src
+
+    def window(self, src, latitude, longitude, radius):
+        # The point's square neighbourhood, in the band's own (UTM) grid.
+        xs, ys = warp.transform("EPSG:4326", src.crs, [longitude], [latitude])
+        x, y = xs[0], ys[0]
+        window = windows.from_bounds(x - radius, y - radius, x + radius, y + radius, src.transform)
+        window = window.round_offsets().round_lengths()
+        full = windows.Window(0, 0, src.width, src.height)
+        if window.col_off >= src.width or window.row_off >= src.height or \
+                window.col_off + window.width <= 0 or window.row_off + window.height <= 0:
+            return None
+        return window.intersection(full)
+
+    def read(self, product_id, band, latitude, longitude, radius, size=None):
+        # Returns the window as a masked DN array; size reads it decimated, which GDAL
+        # serves from the file's overviews instead of the full-resolution data.
+        with self.open(product_id, band) as src:
+            window = self.window(src, latitude, longitude, radius)
+            if window is None:
+                return None
+            out_shape = None
+            if size and max(window.width, window.height) > size:
+                scale = size / max(window.width, window.height)
+                out_shape = (max(1, round(window.height * scale)), max(1, round(window.width * scale)))
+            data = src.read(1, window=window, out_shape=out_shape, masked=True)
+            if src.nodata is None:
+                data = np.ma.masked_equal(data, NODATA)
+        return data
+
+    def sample(self, product_id, bands, points):
+        # Values at many (latitude, longitude) points, opening each band once. Returns an
+        # array of shape (points, bands): reflectance for Level-2 products, DN otherwise,
+        # and NaN for no-data or points outside the scene.
+        values = np.full((len(points), len(bands)), np.nan)
+        if not points:
+            return values
+        latitudes, longitudes = zip(*points)
+        for column, band in enumerate(bands):
+            with self.open(product_id, band) as src:
+                if column == 0:
+                    xs, ys = warp.transform("EPSG:4326", src.crs, list(longitudes), list(latitudes))
+                    left, bottom, right, top = src.bounds
+                    inside = [i for i, (x, y) in enumerate(zip(xs, ys)) if left <= x < right and bottom < y <= top]
+                    coordinates = [(xs[i], ys[i]) for i in inside]
+                if not inside:
+                    break
+                dn = np.ma.concatenate([pixel[:1] for pixel in src.sample(coordinates, masked=True)])
+            dn = np.ma.masked_equal(dn, NODATA)
+            band_values = to_reflectance(dn) if is_level2(product_id) else dn.astype(np.float64)
+            values[inside, column] = band_values.filled(np.nan)
+        return values
+
+    def stretch(self, product_id, band, percentiles=(2, 98)):
+        key = (product_id, band, tuple(percentiles))
+        with self._lock:
+            if key in self._stretches:
+                return self._stretches[key]
+
+        # Percentiles from a decimated read of the whole band, i.e. from its overviews.
+        with self.open(product_id, band) as src:
+            factor = max(1, math.ceil(max(src.width, src.height) / self.stretch_size))
+            data = src.read(1, out_shape=(max(1, src.height // factor), max(1, src.width // factor)), masked=True)
+        values = data.compressed()
+        values = values[values != NODATA]
+        if values.size == 0:
+            stretch = (0.0, 1.0)
+        else:
+            low, high = np.percentile(values, percentiles)
+            stretch = (float(low), float(max(high, low + 1)))
+
+        with self._lock:
+            self._stretches[key] = stretch
+        return stretch
+
+    def render(self, product_id, bands, latitude, longitude, radius, size=None):
+        channels = []
+        mask = None
+        for band in bands:
+            data = self.read(product_id, band, latitude, longitude, radius, size)
+            if data is None:
+                return None
+            low, high = self.stretch(product_id, band)
+            scaled = (np.ma.getdata(data).astype(np.float32) - low) * (255 / (high - low))
+            channels.append(np.clip(scaled, 0, 255).astype(np.uint8))
+            band_mask = np.ma.getmaskarray(data)
+            mask = band_mask if mask is None else mask | band_mask
+        alpha = np.where(mask, 0, 255).astype(np.uint8)
+        if len(channels) == 1:
+            channels = channels * 3
+        return Image.fromarray(np.dstack(channels + [alpha]), "RGBA")
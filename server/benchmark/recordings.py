@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tle import tle_checksum  # noqa: E402
+
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+SATELLITES = {39084: "LANDSAT 8", 49260: "LANDSAT 9"}
+
+M2M_ENDPOINTS = ("dataset-search", "scene-search", "download-options")
+
+
+def recording_path(directory, name):
+    return os.path.join(directory, name)
+
+
+def tle_name(catalog_number):
+    return f"tle_{catalog_number}.txt"
+
+
+def make_tle(name, catalog_number, mean_anomaly, epoch):
+    day = (epoch - datetime(epoch.year, 1, 1, tzinfo=timezone.utc)).total_seconds() / 86400 + 1
+    line1 = f"1 {catalog_number:05d}U 13008A   {epoch.year % 100:02d}{day:012.8f}  .00000300  00000+0  76000-4 0  999"
+    line2 = f"2 {catalog_number:05d}  98.2200 340.0000 0001200  90.0000 {mean_anomaly:8.4f} 14.5710000012345"
+    return [name, line1 + str(tle_checksum(line1)), line2 + str(tle_checksum(line2))]
+
+
+def make_cycles(start, end):
+    # Same layout as cycles_full.json: per satellite, "M/D/YYYY" -> cycle day and the
+    # WRS-2 paths imaged that day. Landsat 9 runs eight days behind Landsat 8.
+    paths = {cycle: [] for cycle in range(1, 17)}
+    for path in range(1, 234):
+        paths[(path - 1) * 9 % 16 + 1].append(str(path))
+    data = {}
+    for satellite, offset in (("landsat_8", 0), ("landsat_9", 8)):
+        days = {}
+        day = start
+        while day <= end:
+            cycle = ((day - start).days + offset) % 16 + 1
+            days[f"{day.month}/{day.day}/{day.year}"] = {"cycle": str(cycle), "path": ",".join(paths[cycle])}
+            day += timedelta(days=1)
+        data[satellite] = days
+    return data
+
+
+def make_browse(size, seed=0):
+    # A browse-like image: noisy land surface inside a tilted footprint on a black fill.
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size]
+    surface = rng.integers(40, 200, (size // 8 + 1, size // 8 + 1, 3), dtype=np.uint8)
+    pixels = np.repeat(np.repeat(surface, 8, axis=0), 8, axis=1)[:size, :size]
+    center = size / 2
+    inside = np.abs((x - center) * 0.94 + (y - center) * 0.34) + np.abs((y - center) * 0.94 - (x - center) * 0.34) < size * 0.45
+    pixels[~inside] = 0
+    return Image.fromarray(pixels, "RGB")
+
+
+def make_m2m(scenes=2):
+    results = []
+    for i in range(scenes):
+        acquired = date(2024, 9, 26) - timedelta(days=16 * i)
+        entity_id = f"LC8137044{acquired.year}{acquired.timetuple().tm_yday:03d}LGN00"
+        results.append({
+            "entityId": entity_id,
+            "displayId": f"LC08_L1TP_137044_{acquired:%Y%m%d}_{acquired:%Y%m%d}_02_T1",
+            "cloudCover": str(10 + i),
+            "temporalCoverage": {"startDate": f"{acquired} 00:00:00", "endDate": f"{acquired} 00:00:00"},
+            "spatialBounds": {"type": "Polygon", "coordinates": [[[89.0, 22.0], [91.5, 22.0], [91.5, 24.5], [89.0, 24.5], [89.0, 22.0]]]},
+        })
+    return {
+        "dataset-search": [{"datasetAlias": "landsat_ot_c2_l1", "collectionName": "Landsat 8-9 OLI/TIRS C2 L1"}],
+        "scene-search": {"recordsReturned": len(results), "totalHits": len(results), "nextRecord": None, "results": results},
+        "download-options": [{
+            "entityId": scene["entityId"], "id": "p" + scene["entityId"], "available": True,
+            "downloadName": "Full Resolution Browse (Reflective Color) JPEG",
+        } for scene in results],
+    }
+
+
+def write_synthetic(directory=DEFAULT_DIR, browse_size=2048):
+    os.makedirs(directory, exist_ok=True)
+    now = datetime.now(timezone.utc)
+    for mean_anomaly, (catalog_number, name) in zip((270.1, 90.1), SATELLITES.items()):
+        with open(recording_path(directory, tle_name(catalog_number)), "w") as f:
+            f.write("\r\n".join(make_tle(name, catalog_number, mean_anomaly, now)) + "\r\n")
+    with open(recording_path(directory, "cycles_full.json"), "w") as f:
+        json.dump(make_cycles(date(2024, 1, 1), now.date() + timedelta(days=365)), f)
+    with open(recording_path(directory, "m2m.json"), "w") as f:
+        json.dump(make_m2m(), f, indent=1)
+    make_browse(browse_size).save(recording_path(directory, "browse.jpg"), "JPEG", quality=90)
+
+
+def record_live(directory, username, token, latitude=23.8041, longitude=90.4152):
+    # Replaces the synthetic recordings with real responses. Needs network access and
+    # M2M credentials; the browse image of the first scene is saved as well.
+    import requests
+
+    from m2m import M2MSession
+
+    os.makedirs(directory, exist_ok=True)
+    for catalog_number in SATELLITES:
+        response = requests.get(f"https://celestrak.org/NORAD/elements/gp.php?CATNR={catalog_number}&FORMAT=TLE", timeout=30)
+        response.raise_for_status()
+        with open(recording_path(directory, tle_name(catalog_number)), "w") as f:
+            f.write(response.text)
+    response = requests.get("https://landsat.usgs.gov/sites/default/files/landsat_acq/assets/json/cycles_full.json", timeout=60)
+    response.raise_for_status()
+    with open(recording_path(directory, "cycles_full.json"), "wb") as f:
+        f.write(response.content)
+
+    session = M2MSession(username, token)
+    box = {'filterType': 'mbr',
+           'lowerLeft': {'latitude': latitude - 0.01, 'longitude': longitude - 0.01},
+           'upperRight': {'latitude': latitude + 0.01, 'longitude': longitude + 0.01}}
+    recorded = {"dataset-search": session.send_request("dataset-search", {'datasetName': "Landsat 8-9", 'spatialFilter': box})}
+    recorded["scene-search"] = session.send_request("scene-search", {
+        'datasetName': 'landsat_ot_c2_l1', 'maxResults': 2, 'startingNumber': 1,
+        'sceneFilter': {'spatialFilter': box, 'cloudCoverFilter': {'max': 30}, 'browseOnly': True}})
+    entity_ids = [scene['entityId'] for scene in recorded["scene-search"]['results']]
+    recorded["download-options"] = session.send_request("download-options", {
+        'datasetName': 'landsat_ot_c2_l1', 'entityIds': entity_ids, 'includeSecondaryFileGroups': False})
+    downloads = [{'entityId': product['entityId'], 'productId': product['id']} for product in recorded["download-options"]
+                 if product['available'] and 'Full Resolution Browse (Reflective Color) JPEG' in (product['downloadName'] or '')]
+    available = session.send_request("download-request", {'downloads': downloads[:1], 'label': 'benchmark'})['availableDownloads']
+    if available:
+        response = session.http.get(available[0]['url'], timeout=300)
+        response.raise_for_status()
+        with open(recording_path(directory, "browse.jpg"), "wb") as f:
+            f.write(response.content)
+    session.close()
+    with open(recording_path(directory, "m2m.json"), "w") as f:
+        json.dump(recorded, f, indent=1)
+
+
+def ensure_recordings(directory=DEFAULT_DIR, browse_size=2048):
+    names = [tle_name(number) for number in SATELLITES] + ["cycles_full.json", "m2m.json", "browse.jpg"]
+    if not all(os.path.exists(recording_path(directory, name)) for name in names):
+        write_synthetic(directory, browse_size)
@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from recordings import DEFAULT_DIR, ensure_recordings, record_live
+from stub import StubServer
+
+
+ENDPOINTS = {
+    "satellite-data": "/satellite-data",
+    "next-acq-date": "/next-acq-date?path=137",
+    "get_landsat_data": "/get_landsat_data?latitude=23.8041&longitude=90.4152&num_scenes=2",
+}
+
+# Relative change allowed before a result counts as a regression.
+DEFAULT_TOLERANCE = 0.2
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(stub_url, cache_dir, cold, timeout=60):
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve_app.py"),
+                                "--stub-url", stub_url, "--cache-dir", cache_dir, "--port", str(port)]
+                               + (["--cold"] if cold else []),
+                               stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("App server exited during startup")
+        try:
+            requests.get(url + "/satellite-data", timeout=5)
+            return process, url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("App server did not start")
+
+
+def run_load(url, total, concurrency):
+    local = threading.local()
+
+    def one(_):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = local.session.get(url, timeout=300)
+            ok = response.status_code == 200
+            size = len(response.content)
+        except requests.exceptions.RequestException:
+            ok, size = False, 0
+        return time.perf_counter() - started, ok, size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([latency for latency, _, _ in results]) * 1000
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": sum(1 for _, ok, _ in results if not ok),
+        "throughput": total / elapsed,
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p90_ms": float(np.percentile(latencies, 90)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+        "bytes": sum(size for _, _, size in results),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, runs in results.items():
+        for concurrency, result in runs.items():
+            base = baseline.get(name, {}).get(concurrency)
+            if base is None:
+                continue
+            for metric in ("p50_ms", "p99_ms"):
+                if result[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(f"{name} c={concurrency} {metric}: {base[metric]:.1f} -> {result[metric]:.1f}")
+            if result["throughput"] < base["throughput"] * (1 - tolerance):
+                regressions.append(f"{name} c={concurrency} throughput: {base['throughput']:.1f} -> {result['throughput']:.1f}")
+            if result["errors"] > base["errors"]:
+                regressions.append(f"{name} c={concurrency} errors: {base['errors']} -> {result['errors']}")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'endpoint':<20}{'c':>4}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, runs in results.items():
+        for concurrency, result in runs.items():
+            print(f"{name:<20}{concurrency:>4}{result['throughput']:>10.1f}{result['p50_ms']:>10.1f}"
+                  f"{result['p90_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the server against recorded USGS/Celestrak responses.")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,8", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of delay added by the stub to every response")
+    parser.add_argument("--cold", action="store_true", help="run with the processed image cache disabled")
+    parser.add_argument("--recordings", default=DEFAULT_DIR)
+    parser.add_argument("--browse-size", type=int, default=2048, help="size of the synthetic browse JPEG")
+    parser.add_argument("--record", action="store_true", help="record live responses first (needs network and config.py)")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="compare against a saved baseline and fail on regressions")
+    parser.add_argument("--save-baseline", help="save the results as a baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.record:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from config import Config
+        record_live(args.recordings, Config.USERNAME, Config.TOKEN)
+    ensure_recordings(args.recordings, args.browse_size)
+
+    stub = StubServer(args.recordings, latency=args.latency)
+    stub.start()
+    cache_dir = tempfile.mkdtemp(prefix="benchmark-cache-")
+    process, url = start_app(stub.url, cache_dir, args.cold)
+    results = {}
+    try:
+        for name in args.endpoints.split(","):
+            results[name] = {}
+            for concurrency in [int(level) for level in args.concurrency.split(",")]:
+                run_load(url + ENDPOINTS[name], args.warmup, 1)
+                results[name][str(concurrency)] = run_load(url + ENDPOINTS[name], args.requests, concurrency)
+    finally:
+        process.terminate()
+        process.wait()
+        stub.shutdown()
+
+    print_table(results)
+    report = {"settings": {"requests": args.requests, "latency": args.latency, "cold": args.cold}, "results": results}
+    for filename in (args.output, args.save_baseline):
+        if filename:
+            with open(filename, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
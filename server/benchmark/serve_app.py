@@ -0,0 +1,45 @@
+import argparse
+import logging
+import os
+import sys
+import types
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the app against the benchmark stub server.")
+    parser.add_argument("--stub-url", required=True)
+    parser.add_argument("--cache-dir", required=True)
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--cold", action="store_true", help="disable the processed image cache")
+    args = parser.parse_args()
+
+    # The app reads everything from config.Config; point it at the stub instead of the
+    # real services and at a throwaway cache.
+    class Config:
+        USERNAME = "benchmark"
+        TOKEN = "benchmark"
+        CACHE_DIR = args.cache_dir
+        WRS_DIR = os.path.join(args.cache_dir, "no-wrs")
+        CELESTRAK_URL = f"{args.stub_url}/celestrak"
+        CYCLES_URL = f"{args.stub_url}/cycles_full.json"
+        M2M_SERVICE_URL = f"{args.stub_url}/m2m/"
+        IMAGE_CACHE_MAX_BYTES = 1 if args.cold else 2 * 1024 ** 3
+
+    config = types.ModuleType("config")
+    config.Config = Config
+    sys.modules["config"] = config
+    sys.path.insert(0, SERVER_DIR)
+
+    import app
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", args.port, app.app, threaded=True)
+    print(f"Serving on http://127.0.0.1:{args.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from recordings import SATELLITES, recording_path, tle_name
+
+
+class StubServer(ThreadingHTTPServer):
+    # Replays recorded Celestrak, cycles and M2M responses and serves the browse JPEG.
+    # latency adds a fixed delay to every response, to stand in for the real services.
+    daemon_threads = True
+
+    def __init__(self, directory, host="127.0.0.1", port=0, latency=0.0):
+        super().__init__((host, port), StubHandler)
+        self.latency = latency
+        self.files = {}
+        for catalog_number in SATELLITES:
+            self.files[tle_name(catalog_number)] = self._read(directory, tle_name(catalog_number))
+        for name in ("cycles_full.json", "m2m.json", "browse.jpg"):
+            self.files[name] = self._read(directory, name)
+        self.m2m = json.loads(self.files["m2m.json"])
+        self.cycles_etag = '"' + hashlib.sha256(self.files["cycles_full.json"]).hexdigest()[:16] + '"'
+
+    @staticmethod
+    def _read(directory, name):
+        with open(recording_path(directory, name), "rb") as f:
+            return f.read()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, delayed ACKs add ~40 ms per response.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/celestrak":
+            catalog_number = int(parse_qs(url.query).get("CATNR", ["0"])[0])
+            if catalog_number not in SATELLITES:
+                return self._send(404)
+            return self._send(200, self.server.files[tle_name(catalog_number)], "text/plain")
+        if url.path == "/cycles_full.json":
+            if self.headers.get("If-None-Match") == self.server.cycles_etag:
+                return self._send(304, headers={"ETag": self.server.cycles_etag})
+            return self._send(200, self.server.files["cycles_full.json"], headers={"ETag": self.server.cycles_etag})
+        if url.path.startswith("/browse/"):
+            return self._send(200, self.server.files["browse.jpg"], "image/jpeg")
+        self._send(404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)) or 0)
+        endpoint = urlparse(self.path).path.rsplit("/", 1)[-1]
+        data = json.loads(body or b"{}")
+        if endpoint == "login-token":
+            result = "benchmark-api-key"
+        elif endpoint == "logout":
+            result = None
+        elif endpoint == "download-request":
+            result = {"availableDownloads": [{
+                "entityId": download["entityId"],
+                "url": f"{self.server.url}/browse/{download['entityId']}.jpg",
+            } for download in data.get("downloads", [])]}
+        elif endpoint in self.server.m2m:
+            result = self.server.m2m[endpoint]
+        else:
+            return self._send(200, json.dumps({"errorCode": "UNKNOWN_ENDPOINT", "errorMessage": endpoint, "data": None}).encode())
+        self._send(200, json.dumps({"errorCode": None, "data": result}).encode())
@@ -0,0 +1,201 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    name TEXT PRIMARY KEY,
+    alias TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scenes (
+    dataset TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    display_id TEXT,
+    path INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    acquired TEXT NOT NULL,
+    cloud_cover REAL,
+    metadata TEXT NOT NULL,
+    download_options TEXT,
+    PRIMARY KEY (dataset, entity_id)
+);
+CREATE INDEX IF NOT EXISTS scenes_tile ON scenes (dataset, path, row, acquired);
+CREATE TABLE IF NOT EXISTS coverage (
+    dataset TEXT NOT NULL,
+    path INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_tile ON coverage (dataset, path, row, start);
+CREATE TABLE IF NOT EXISTS locations (
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    path INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (latitude, longitude, path, row)
+);
+"""
+
+# Landsat passes over every WRS-2 tile once in this many days.
+REPEAT_DAYS = 16
+
+# Locations are stored rounded to this many decimals, about a kilometre; scene searches
+# around a point cover 0.01 degrees either side of it.
+LOCATION_DECIMALS = 2
+
+
+def parse_display_id(display_id):
+    # LC09_L1TP_137044_20240926_20240927_02_T1 -> (137, 44, "2024-09-26")
+    parts = display_id.split("_")
+    acquired = date(int(parts[3][:4]), int(parts[3][4:6]), int(parts[3][6:8]))
+    return int(parts[2][:3]), int(parts[2][3:]), acquired.isoformat()
+
+
+def day_before(day):
+    return (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+
+
+def day_after(day):
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+class SceneCatalog:
+    # Scene-search results by WRS-2 path/row, plus the date intervals already searched
+    # for each tile, so repeat queries are answered locally.
+    def __init__(self, filename, settle_days=14):
+        self.filename = filename
+        self.settle_days = settle_days
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self._db = self._connect()
+        self._db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.filename, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def after_fork(self):
+        # SQLite connections must not be used across fork; the parent's is left alone.
+        self._lock = threading.Lock()
+        self._db = self._connect()
+
+    def dataset_alias(self, name):
+        with self._lock:
+            row = self._db.execute("SELECT alias FROM datasets WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_dataset_alias(self, name, alias):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO datasets (name, alias) VALUES (?, ?)", (name, alias))
+
+    def tiles_at(self, latitude, longitude):
+        # The path/rows a search around this point has found, for use without the WRS-2
+        # index; empty if the point has not been searched.
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, row FROM locations WHERE latitude = ? AND longitude = ? ORDER BY path, row",
+                (round(latitude, LOCATION_DECIMALS), round(longitude, LOCATION_DECIMALS))).fetchall()
+        return [tuple(row) for row in rows]
+
+    def set_tiles_at(self, latitude, longitude, tiles):
+        latitude, longitude = round(latitude, LOCATION_DECIMALS), round(longitude, LOCATION_DECIMALS)
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR IGNORE INTO locations (latitude, longitude, path, row) VALUES (?, ?, ?, ?)",
+                                 [(latitude, longitude, path, row) for path, row in tiles])
+
+    def missing_intervals(self, dataset, path, row, start, end):
+        # Recent acquisitions are still being published, so the last settle_days are
+        # never treated as searched.
+        settled = (date.today() - timedelta(days=self.settle_days)).isoformat()
+        with self._lock:
+            intervals = self._db.execute(
+                "SELECT start, end FROM coverage WHERE dataset = ? AND path = ? AND row = ? "
+                "AND end >= ? AND start <= ? ORDER BY start",
+                (dataset, path, row, start, end)).fetchall()
+        missing = []
+        cursor = start
+        for covered_start, covered_end in intervals:
+            covered_end = min(covered_end, settled)
+            if covered_end < covered_start:
+                continue
+            if covered_start > cursor:
+                missing.append((cursor, min(day_before(covered_start), end)))
+            if covered_end >= cursor:
+                cursor = day_after(covered_end)
+            if cursor > end:
+                break
+        if cursor <= end:
+            missing.append((cursor, end))
+        return missing
+
+    def add_scenes(self, dataset, path, row, start, end, scenes):
+        with self._lock, self._db:
+            for scene in scenes:
+                scene_path, scene_row, acquired = parse_display_id(scene["displayId"])
+                if (scene_path, scene_row) != (path, row):
+                    continue
+                cloud_cover = scene.get("cloudCover")
+                self._db.execute(
+                    "INSERT INTO scenes (dataset, entity_id, display_id, path, row, acquired, cloud_cover, metadata) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (dataset, entity_id) DO UPDATE SET "
+                    "cloud_cover = excluded.cloud_cover, metadata = excluded.metadata",
+                    (dataset, scene["entityId"], scene["displayId"], path, row, acquired,
+                     None if cloud_cover is None else float(cloud_cover), json.dumps(scene)))
+            self._add_coverage(dataset, path, row, start, end)
+
+    def _add_coverage(self, dataset, path, row, start, end):
+        # Merge with any overlapping or adjacent intervals so the table stays small.
+        overlapping = self._db.execute(
+            "SELECT rowid, start, end FROM coverage WHERE dataset = ? AND path = ? AND row = ? "
+            "AND end >= ? AND start <= ?",
+            (dataset, path, row, day_before(start), day_after(end))).fetchall()
+        for rowid, covered_start, covered_end in overlapping:
+            start, end = min(start, covered_start), max(end, covered_end)
+            self._db.execute("DELETE FROM coverage WHERE rowid = ?", (rowid,))
+        self._db.execute("INSERT INTO coverage (dataset, path, row, start, end) VALUES (?, ?, ?, ?, ?)",
+                         (dataset, path, row, start, end))
+
+    def scenes(self, dataset, tiles, start, end, cloud_cover=100, limit=None):
+        tiles = list(tiles)
+        if not tiles:
+            return []
+        tile_filter = " OR ".join(["(path = ? AND row = ?)"] * len(tiles))
+        query = (f"SELECT metadata FROM scenes WHERE dataset = ? AND ({tile_filter}) "
+                 "AND acquired BETWEEN ? AND ? AND (cloud_cover IS NULL OR cloud_cover <= ?) "
+                 "ORDER BY acquired DESC, entity_id")
+        params = [dataset] + [value for tile in tiles for value in tile] + [start, end, cloud_cover]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [json.loads(metadata) for metadata, in self._db.execute(query, params)]
+
+    def download_options(self, dataset, entity_ids):
+        # entityId -> cached download-options entries, for the scenes that have them.
+        if not entity_ids:
+            return {}
+        placeholders = ",".join("?" * len(entity_ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT entity_id, download_options FROM scenes WHERE dataset = ? "
+                f"AND entity_id IN ({placeholders}) AND download_options IS NOT NULL",
+                [dataset] + list(entity_ids)).fetchall()
+        return {entity_id: json.loads(options) for entity_id, options in rows}
+
+    def set_download_options(self, dataset, options):
+        by_entity = {}
+        for product in options:
+            by_entity.setdefault(product["entityId"], []).append(product)
+        with self._lock, self._db:
+            for entity_id, products in by_entity.items():
+                self._db.execute("UPDATE scenes SET download_options = ? WHERE dataset = ? AND entity_id = ?",
+                                 (json.dumps(products), dataset, entity_id))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
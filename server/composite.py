@@ -0,0 +1,82 @@
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+
+METHODS = ("median", "best")
+
+
+def align(img, bounds, reference_bounds, size):
+    # Resample a scene onto the reference footprint. Browse images are not georeferenced,
+    # so like the map overlay this maps the scene's bounds linearly onto its pixels.
+    if bounds is None or reference_bounds is None or bounds == reference_bounds:
+        return img if img.size == size else img.resize(size, Image.NEAREST)
+    south, west, north, east = bounds
+    ref_south, ref_west, ref_north, ref_east = reference_bounds
+    width, height = img.size
+    box = (
+        (ref_west - west) / (east - west) * width,
+        (north - ref_north) / (north - south) * height,
+        (ref_east - west) / (east - west) * width,
+        (north - ref_south) / (north - south) * height,
+    )
+    # Nearest neighbour keeps the transparency mask exact at the scene edges.
+    return img.transform(size, Image.EXTENT, box, Image.NEAREST, fillcolor=(0, 0, 0, 0))
+
+
+class SceneStack:
+    # Aligned scenes are kept in a memory-mapped temporary file, not in RAM.
+    def __init__(self, count, size, directory=None):
+        width, height = size
+        self.size = size
+        self.count = 0
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self.array = np.memmap(self._file, dtype=np.uint8, mode="w+", shape=(count, height, width, 4))
+
+    def add(self, img):
+        self.array[self.count] = np.asarray(img.convert("RGBA"))
+        self.count += 1
+
+    def close(self):
+        del self.array
+        self._file.close()
+
+
+def composite(stack, method="median", ranks=None, strip_bytes=16 * 1024 ** 2):
+    # Pixels with zero alpha (black or outside a scene) are missing data.
+    count, height, width, _ = stack.shape
+    output = np.zeros((height, width, 4), dtype=np.uint8)
+    if ranks is None:
+        ranks = np.arange(count)
+    ranks = np.asarray(ranks, dtype=np.float64)[:, None, None]
+    rows = max(1, strip_bytes // (count * width * 10))
+
+    for top in range(0, height, rows):
+        strip = np.asarray(stack[:, top:top + rows])
+        valid = strip[..., 3] > 0
+        covered = valid.any(axis=0)
+
+        if method == "median":
+            # Missing values sort last, so the first n_valid entries of each pixel are its data.
+            values = np.where(valid[..., None], strip[..., :3].astype(np.uint16), 256)
+            values.sort(axis=0)
+            n_valid = valid.sum(axis=0)
+            lower = np.maximum(n_valid - 1, 0) // 2
+            upper = np.minimum(n_valid // 2, count - 1)
+            shape = (1,) + values.shape[1:]
+            low = np.take_along_axis(values, np.broadcast_to(lower[None, ..., None], shape), axis=0)[0]
+            high = np.take_along_axis(values, np.broadcast_to(upper[None, ..., None], shape), axis=0)[0]
+            pixels = np.empty(strip.shape[1:], dtype=np.uint8)
+            pixels[..., :3] = (low + high + 1) // 2
+            pixels[..., 3] = 255
+        elif method == "best":
+            # Each pixel comes from the best-ranked scene that has data there.
+            choice = np.where(valid, ranks, np.inf).argmin(axis=0)
+            shape = (1,) + strip.shape[1:]
+            pixels = np.take_along_axis(strip, np.broadcast_to(choice[None, ..., None], shape), axis=0)[0]
+        else:
+            raise ValueError(f"Composite method must be one of {', '.join(METHODS)}.")
+
+        output[top:top + rows] = np.where(covered[..., None], pixels, 0)
+    return Image.fromarray(output, "RGBA")
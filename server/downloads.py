@@ -0,0 +1,66 @@
+import contextvars
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import DOWNLOADED_BYTES, stage
+
+
+CHUNK_SIZE = 1024 ** 2
+
+
+def download_to_spool(http, url, timeout=300, read_timeout=60, spool_bytes=16 * 1024 ** 2, spool_dir=None):
+    # Small files stay in memory; larger ones roll over to a temporary file on disk.
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes, dir=spool_dir)
+    deadline = time.monotonic() + timeout
+    try:
+        with stage("download"), http.get(url, stream=True, timeout=(10, read_timeout)) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Download of {url} took longer than {timeout} seconds")
+                spool.write(chunk)
+                DOWNLOADED_BYTES.inc(len(chunk), source="browse")
+        spool.seek(0)
+        return spool
+    except BaseException:
+        spool.close()
+        raise
+
+
+def _close_result(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class DownloadPool:
+    def __init__(self, max_workers=4, timeout=300, read_timeout=60, spool_bytes=16 * 1024 ** 2, spool_dir=None):
+        self.timeout = timeout
+        self.read_timeout = read_timeout
+        self.spool_bytes = spool_bytes
+        self.spool_dir = spool_dir
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download")
+
+    def submit(self, http, url):
+        # Run in a copy of the caller's context so the download is timed against its request.
+        return self.executor.submit(contextvars.copy_context().run, download_to_spool, http, url,
+                                    self.timeout, self.read_timeout,
+                                    self.spool_bytes, self.spool_dir)
+
+    def fetch(self, http, urls):
+        # Yields (index, spool, error) in completion order. The caller owns each spool it
+        # receives; closing the generator early cancels queued downloads and discards the rest.
+        futures = {self.submit(http, url): index for index, url in enumerate(urls)}
+        pending = set(futures)
+        try:
+            for future in as_completed(futures):
+                pending.discard(future)
+                error = future.exception()
+                yield futures[future], None if error else future.result(), error
+        finally:
+            for future in pending:
+                future.cancel()
+                future.add_done_callback(_close_result)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,63 @@
+import io
+
+from PIL import Image
+
+
+FORMATS = {
+    "png": ("png", "image/png"),
+    "webp": ("webp", "image/webp"),
+    "jpeg": ("jpg", "image/jpeg"),
+}
+
+DEFAULT_ENCODING = {"format": "png", "quality": None, "compress_level": 6, "max_size": None, "mask": False}
+
+
+def parse_encoding(args, accept=""):
+    fmt = args.get("format", "png").lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt == "auto":
+        fmt = "webp" if "image/webp" in accept else "png"
+    if fmt not in FORMATS:
+        raise ValueError(f"Format must be one of {', '.join(FORMATS)} or auto.")
+
+    mask = args.get("mask", "0").lower() in ("1", "true")
+    encoding = dict(DEFAULT_ENCODING, format="png" if mask else fmt, mask=mask)
+    if encoding["format"] in ("webp", "jpeg"):
+        encoding["quality"] = int(args.get("quality", 85))
+        if not 1 <= encoding["quality"] <= 100:
+            raise ValueError("Quality must be between 1 and 100.")
+    if encoding["format"] == "png":
+        encoding["compress_level"] = int(args.get("compress_level", 6))
+        if not 0 <= encoding["compress_level"] <= 9:
+            raise ValueError("Compress level must be between 0 and 9.")
+    if args.get("max_size"):
+        encoding["max_size"] = int(args["max_size"])
+        if encoding["max_size"] < 1:
+            raise ValueError("Max size must be positive.")
+    return encoding
+
+
+def variant_params(encoding):
+    # Only non-default settings go into the cache key, so the plain PNG keeps its key.
+    return {name: value for name, value in encoding.items() if value != DEFAULT_ENCODING[name]}
+
+
+def encode_image(img, encoding):
+    ext, mimetype = FORMATS[encoding["format"]]
+    if encoding["max_size"] and max(img.size) > encoding["max_size"]:
+        img = img.copy()
+        img.thumbnail((encoding["max_size"], encoding["max_size"]), Image.LANCZOS, reducing_gap=3.0)
+
+    if encoding["mask"]:
+        img = img.getchannel("A").point(lambda value: 255 if value else 0).convert("1")
+
+    img_io = io.BytesIO()
+    if encoding["format"] == "png":
+        img.save(img_io, "PNG", compress_level=encoding["compress_level"])
+    elif encoding["format"] == "webp":
+        img.save(img_io, "WEBP", quality=encoding["quality"], lossless=encoding["quality"] == 100, method=4)
+    else:
+        # Transparency goes out separately through mask=1.
+        img.convert("RGB").save(img_io, "JPEG", quality=encoding["quality"])
+    return img_io.getvalue(), ext, mimetype
@@ -0,0 +1,245 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from skyfield.api import wgs84
+from skyfield.framelib import itrs
+
+from tle import tle_epoch
+
+
+SCALES = {"latitude": 1e4, "longitude": 1e4, "altitude": 1e3}
+
+
+def compute_ground_track(satellite, ts, start, window, step):
+    offsets = np.arange(0, window + 1, step, dtype=float)
+    t = ts.utc(start.year, start.month, start.day, start.hour, start.minute, start.second + offsets)
+    position = wgs84.geographic_position_of(satellite.at(t))
+    return {
+        "latitude": position.latitude.degrees,
+        "longitude": position.longitude.degrees,
+        "altitude": position.elevation.km,
+    }
+
+
+def encode_track(track, delta=False):
+    encoded = {}
+    for key, scale in SCALES.items():
+        values = np.round(track[key] * scale).astype(np.int64)
+        if delta:
+            # First value is absolute, the rest are differences from the previous sample.
+            values = np.diff(values, prepend=0)
+            encoded[key] = values.tolist()
+        else:
+            encoded[key] = (values / scale).tolist()
+    return encoded
+
+
+class GroundTrackCache:
+    def __init__(self, ts, max_entries=64):
+        self.ts = ts
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._tracks = OrderedDict()
+
+    def get(self, satellite, tle, start, window, step, delta=False):
+        key = (tle[1], tle[2], start, window, step, delta)
+        with self._lock:
+            if key in self._tracks:
+                self._tracks.move_to_end(key)
+                return self._tracks[key]
+
+        track = compute_ground_track(satellite, self.ts, start, window, step)
+        result = {
+            "name": tle[0].strip().title(),
+            "epoch": tle_epoch(tle).isoformat(),
+            "start": start.isoformat(),
+            "step": step,
+            "count": len(track["latitude"]),
+            "delta": delta,
+            "scale": SCALES if delta else None,
+        }
+        result.update(encode_track(track, delta))
+
+        with self._lock:
+            self._tracks[key] = result
+            while len(self._tracks) > self.max_entries:
+                self._tracks.popitem(last=False)
+        return result
+
+
+def propagate(satellite, ts, start, window, step):
+    # Earth-fixed (ITRS) positions in km, shape (samples, 3), plus the sample times.
+    offsets = np.arange(0, window + 1, step, dtype=float)
+    t = ts.utc(start.year, start.month, start.day, start.hour, start.minute, start.second + offsets)
+    return offsets, satellite.at(t).frame_xyz(itrs).km.T
+
+
+def observer_frames(latitudes, longitudes):
+    # Earth-fixed positions in km and local vertical (ellipsoid normal) unit vectors, shape (locations, 3).
+    observers = wgs84.latlon(latitudes, longitudes).itrs_xyz.km.T
+    lat, lon = np.radians(latitudes), np.radians(longitudes)
+    up = np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+    return observers, up
+
+
+def elevations(positions, latitudes, longitudes):
+    # Elevation in degrees of every sample as seen from every location, shape (locations, samples).
+    observers, up = observer_frames(latitudes, longitudes)
+    height = up @ positions.T - np.sum(up * observers, axis=1)[:, None]
+    distance = np.sqrt(np.maximum(np.sum(positions ** 2, axis=1)[None, :] + np.sum(observers ** 2, axis=1)[:, None]
+                                  - 2 * observers @ positions.T, 1e-9))
+    return np.degrees(np.arcsin(np.clip(height / distance, -1, 1)))
+
+
+def exact_elevations(satellite, ts, start, offsets, observers, up):
+    # Elevation in degrees at each offset from start, as seen from the matching observer:
+    # one SGP4 propagation for all of them.
+    t = ts.utc(start.year, start.month, start.day, start.hour, start.minute, start.second + offsets)
+    relative = satellite.at(t).frame_xyz(itrs).km.T - observers
+    distance = np.sqrt(np.sum(relative ** 2, axis=1))
+    return np.degrees(np.arcsin(np.clip(np.sum(up * relative, axis=1) / distance, -1, 1)))
+
+
+def find_passes(offsets, positions, elevation, min_elevation, after, until, count):
+    # Passes are runs of samples above min_elevation. Times are first estimated from the
+    # samples, rise and set linearly and the culmination with a parabola through the
+    # highest three; refine_passes then solves for them exactly. "samples" keeps the
+    # sample indices of the rise, culmination and set for that.
+    step = offsets[1] - offsets[0]
+    above = np.concatenate([[0], (elevation > min_elevation).astype(np.int8), [0]])
+    edges = np.diff(above)
+    passes = []
+    for first, last in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1):
+        if first == 0 or last == len(elevation) - 1:
+            continue
+        set_time = offsets[last] + step * (elevation[last] - min_elevation) / (elevation[last] - elevation[last + 1])
+        if set_time <= after:
+            continue
+        rise_time = offsets[first - 1] + step * (min_elevation - elevation[first - 1]) / (elevation[first] - elevation[first - 1])
+        if rise_time > until:
+            break
+        peak = first + int(np.argmax(elevation[first:last + 1]))
+        before, top, following = elevation[peak - 1], elevation[peak], elevation[peak + 1]
+        curvature = before - 2 * top + following
+        shift = 0.5 * (before - following) / curvature if curvature < 0 else 0.0
+        passes.append({
+            "rise": rise_time,
+            "culmination": offsets[peak] + shift * step,
+            "set": set_time,
+            "max_elevation": float(top - 0.25 * (before - following) * shift),
+            "direction": "descending" if positions[peak + 1, 2] < positions[peak - 1, 2] else "ascending",
+            "samples": (first, peak, last),
+        })
+        if len(passes) == count:
+            break
+    return passes
+
+
+GOLDEN_RATIO = (np.sqrt(5) - 1) / 2
+
+
+def refine_passes(satellite, ts, start, offsets, latitudes, longitudes, passes, min_elevation, tolerance=0.01):
+    # Solves for the rise, set and culmination of the passes found on the sample grid
+    # with exact SGP4 positions, to within tolerance seconds. passes holds a list of
+    # passes per location; all of them are refined together, so every iteration is one
+    # vectorized propagation. Rise and set are bisected within their sample interval,
+    # the culmination is a golden-section search between the samples around the peak.
+    step = offsets[1] - offsets[0]
+    flat = [(location, overpass) for location, location_passes in enumerate(passes) for overpass in location_passes]
+    if not flat:
+        return
+    observers, up = observer_frames(latitudes, longitudes)
+    locations = np.array([location for location, _ in flat])
+    observers, up = observers[locations], up[locations]
+    samples = np.array([overpass.pop("samples") for _, overpass in flat])
+
+    def elevation_at(times):
+        return exact_elevations(satellite, ts, start, times, observers, up)
+
+    def bisect(low, high, rising):
+        # The elevation crosses min_elevation between low and high.
+        for _ in range(int(np.ceil(np.log2(step / tolerance)))):
+            middle = (low + high) / 2
+            above = elevation_at(middle) > min_elevation
+            low, high = np.where(above != rising, middle, low), np.where(above != rising, high, middle)
+        return (low + high) / 2
+
+    rise = bisect(offsets[samples[:, 0] - 1], offsets[samples[:, 0]], True)
+    set_ = bisect(offsets[samples[:, 2]], offsets[samples[:, 2] + 1], False)
+
+    low, high = offsets[samples[:, 1] - 1], offsets[samples[:, 1] + 1]
+    inner_low, inner_high = high - GOLDEN_RATIO * (high - low), low + GOLDEN_RATIO * (high - low)
+    elevation_low, elevation_high = elevation_at(inner_low), elevation_at(inner_high)
+    for _ in range(int(np.ceil(np.log(tolerance / (2 * step)) / np.log(GOLDEN_RATIO)))):
+        left = elevation_low > elevation_high
+        # The maximum is in [low, inner_high] if left, else in [inner_low, high]; one of
+        # the inner points is reused and only the other one is propagated.
+        high = np.where(left, inner_high, high)
+        low = np.where(left, low, inner_low)
+        candidate = np.where(left, high - GOLDEN_RATIO * (high - low), low + GOLDEN_RATIO * (high - low))
+        elevation_candidate = elevation_at(candidate)
+        inner_low, inner_high, elevation_low, elevation_high = (
+            np.where(left, candidate, inner_high), np.where(left, inner_low, candidate),
+            np.where(left, elevation_candidate, elevation_high), np.where(left, elevation_low, elevation_candidate))
+    culmination = np.where(elevation_low > elevation_high, inner_low, inner_high)
+    max_elevation = np.maximum(elevation_low, elevation_high)
+
+    for i, (_, overpass) in enumerate(flat):
+        overpass["rise"] = float(rise[i])
+        overpass["set"] = float(set_[i])
+        overpass["culmination"] = float(culmination[i])
+        overpass["max_elevation"] = float(max_elevation[i])
+
+
+class OverpassPredictor:
+    # Propagation is the expensive part and is shared by every location, so it is
+    # cached per TLE and aligned start time.
+    def __init__(self, ts, max_entries=8, chunk_size=64):
+        self.ts = ts
+        self.max_entries = max_entries
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._positions = OrderedDict()
+
+    def positions(self, satellite, tle, start, window, step):
+        key = (tle[1], tle[2], start, window, step)
+        with self._lock:
+            if key in self._positions:
+                self._positions.move_to_end(key)
+                return self._positions[key]
+
+        result = propagate(satellite, self.ts, start, window, step)
+        with self._lock:
+            self._positions[key] = result
+            while len(self._positions) > self.max_entries:
+                self._positions.popitem(last=False)
+        return result
+
+    def predict(self, satellite, tle, points, start, window, step, now, until, count=5, min_elevation=0.0):
+        offsets, positions = self.positions(satellite, tle, start, window, step)
+        after = (now - start).total_seconds()
+        until = (until - start).total_seconds()
+        latitudes = np.array([point[0] for point in points], dtype=float)
+        longitudes = np.array([point[1] for point in points], dtype=float)
+        results = []
+        for chunk in range(0, len(points), self.chunk_size):
+            chunk_latitudes = latitudes[chunk:chunk + self.chunk_size]
+            chunk_longitudes = longitudes[chunk:chunk + self.chunk_size]
+            elevation = elevations(positions, chunk_latitudes, chunk_longitudes)
+            chunk_passes = [find_passes(offsets, positions, row, min_elevation, after, until, count) for row in elevation]
+            refine_passes(satellite, self.ts, start, offsets, chunk_latitudes, chunk_longitudes, chunk_passes,
+                          min_elevation)
+            for passes in chunk_passes:
+                for overpass in passes:
+                    for name in ("rise", "culmination", "set"):
+                        overpass[name] = (start + timedelta(seconds=overpass[name])).isoformat()
+                results.append(passes)
+        return results
+
+
+def aligned_start(align, now=None):
+    now = now or datetime.now(timezone.utc)
+    seconds = int(now.timestamp()) // align * align
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
@@ -0,0 +1,43 @@
+# gunicorn -c gunicorn.conf.py "wsgi:create_app()"
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+# Each worker keeps its own tile memory cache (TILE_MEMORY_BYTES), download and job
+# pools, so more workers multiply memory rather than share it.
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count(), 4)))
+worker_class = "gthread"
+# Open streams (STREAM_MAX_CLIENTS) and waiting job polls (JOB_MAX_WAITERS) hold a thread
+# each; the rest are left for ordinary requests.
+threads = int(os.environ.get("THREADS", 16))
+timeout = 300
+# Import and warm up the app once in the parent so workers share it copy-on-write.
+preload_app = True
+
+
+def on_starting(server):
+    # Runs after the preload; metrics left by a previous run would be added to this one's.
+    from app import METRICS_DIR
+    from metrics import clear_snapshots
+
+    clear_snapshots(METRICS_DIR)
+
+
+def post_worker_init(worker):
+    from utils import format_memory, memory_usage
+
+    worker.log.info(f"Worker {worker.pid} ready: {format_memory(memory_usage())}")
+
+
+def worker_exit(server, worker):
+    from app import metrics_writer
+
+    if metrics_writer.running:
+        metrics_writer.write()
+
+
+def child_exit(server, worker):
+    from app import METRICS_DIR
+    from metrics import mark_process_dead, registry
+
+    mark_process_dead(METRICS_DIR, worker.pid, registry)
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from utils import file_lock, write_atomic
+
+
+class ImageCache:
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Approximate size, so small writes don't rescan the directory each time. Other
+        # worker processes write to the same directory unseen, so rescan after this one
+        # has written rescan_bytes, which bounds the overshoot to that much per worker.
+        self._total = None
+        self._written = 0
+        self.rescan_bytes = max_bytes // 50
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self._total = None
+        self._written = 0
+
+    @staticmethod
+    def key(entity_id, **params):
+        data = json.dumps({"entityId": entity_id, **params}, sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def path(self, key, ext="png"):
+        return os.path.join(self.directory, key[:2], f"{key}.{ext}")
+
+    def contains(self, key, ext="png"):
+        return os.path.exists(self.path(key, ext))
+
+    def open(self, key, ext="png"):
+        path = self.path(key, ext)
+        try:
+            # Open before touching so a concurrent eviction can't remove the file under us.
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def put(self, key, data, ext="png"):
+        write_atomic(self.path(key, ext), data)
+        with self._lock:
+            full = self._grow(len(data))
+        if full:
+            self.evict()
+        return self.path(key, ext)
+
+    def put_file(self, key, filename, ext="png"):
+        # For results too large to hold in memory: move a finished file into the cache.
+        path = self.path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(filename)
+        shutil.move(filename, path)
+        with self._lock:
+            full = self._grow(size)
+        if full:
+            self.evict()
+        return path
+
+    def _grow(self, size):
+        # Whether the directory needs a rescan; call with _lock held.
+        self._written += size
+        if self._total is None or self._written > self.rescan_bytes:
+            return True
+        self._total += size
+        return self._total > self.max_bytes
+
+    def evict(self):
+        with self._lock, self._process_lock():
+            self._written = 0
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.startswith(".") or name == "evict.lock":
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            self._total = total
+            if total <= self.max_bytes:
+                return
+
+            # Least recently used first; hits refresh the mtime.
+            for _, size, path in sorted(entries):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes * 0.9:
+                    break
+            self._total = total
+
+    def _process_lock(self):
+        return file_lock(os.path.join(self.directory, "evict.lock"))
@@ -0,0 +1,127 @@
+import contextlib
+import math
+
+import numpy as np
+from PIL import Image
+
+from bands import is_level2, rasterio, to_reflectance, windows
+
+
+def ndvi(nir, red):
+    return (nir - red) / (nir + red)
+
+
+def ndwi(green, nir):
+    return (green - nir) / (green + nir)
+
+
+def evi(nir, red, blue):
+    return 2.5 * (nir - red) / (nir + 6 * red - 7.5 * blue + 1)
+
+
+INDICES = {
+    "ndvi": (("nir", "red"), ndvi),
+    "ndwi": (("green", "nir"), ndwi),
+    "evi": (("nir", "red", "blue"), evi),
+}
+
+# Color stops over the index range [-1, 1].
+COLORMAPS = {
+    "ndvi": [(-1.0, (165, 0, 38)), (0.0, (255, 255, 191)), (1.0, (0, 104, 55))],
+    "ndwi": [(-1.0, (140, 81, 10)), (0.0, (245, 245, 245)), (1.0, (1, 102, 94))],
+    "evi": [(-1.0, (165, 0, 38)), (0.0, (255, 255, 191)), (1.0, (0, 104, 55))],
+}
+
+
+def colormap(stops):
+    values = np.linspace(-1, 1, 256)
+    positions = [stop[0] for stop in stops]
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    for channel in range(3):
+        lut[:, channel] = np.round(np.interp(values, positions, [stop[1][channel] for stop in stops]))
+    lut[:, 3] = 255
+    return lut
+
+
+class SpectralIndex:
+    # Computes an index block by block, so memory depends on the block size and not the scene.
+    def __init__(self, reader, product_id, name, latitude=None, longitude=None, radius=None,
+                 size=None, block_size=512):
+        if name not in INDICES:
+            raise ValueError(f"Index must be one of {', '.join(INDICES)}.")
+        if not is_level2(product_id):
+            raise ValueError("Spectral indices need a Level-2 surface reflectance product.")
+        self.reader = reader
+        self.product_id = product_id
+        self.name = name
+        self.bands, self.formula = INDICES[name]
+        self.point = None if latitude is None else (latitude, longitude, radius)
+        self.size = size
+        self.block_size = block_size
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = contextlib.ExitStack()
+        try:
+            self.sources = [self._stack.enter_context(self.reader.open(self.product_id, band)) for band in self.bands]
+            src = self.sources[0]
+            if self.point is None:
+                self.window = windows.Window(0, 0, src.width, src.height)
+            else:
+                self.window = self.reader.window(src, *self.point)
+            if self.window is not None:
+                width, height = int(self.window.width), int(self.window.height)
+                # Whole-pixel decimation, so every output block maps to a whole source window.
+                self.factor = max(1, math.ceil(max(width, height) / self.size)) if self.size else 1
+                self.shape = (math.ceil(height / self.factor), math.ceil(width / self.factor))
+                self.crs = src.crs
+                self.transform = src.window_transform(self.window) * \
+                    rasterio.Affine.scale(width / self.shape[1], height / self.shape[0])
+        except BaseException:
+            self._stack.close()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.close()
+
+    def blocks(self):
+        # Yields (row, col, masked float32 block) in output pixels.
+        height, width = self.shape
+        col_off, row_off = int(self.window.col_off), int(self.window.row_off)
+        src_width, src_height = int(self.window.width), int(self.window.height)
+        for row in range(0, height, self.block_size):
+            for col in range(0, width, self.block_size):
+                rows = min(self.block_size, height - row)
+                cols = min(self.block_size, width - col)
+                window = windows.Window(col_off + col * self.factor, row_off + row * self.factor,
+                                min(cols * self.factor, src_width - col * self.factor),
+                                min(rows * self.factor, src_height - row * self.factor))
+                reflectance = [to_reflectance(src.read(1, window=window, out_shape=(rows, cols), masked=True))
+                               for src in self.sources]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    values = self.formula(*reflectance)
+                values = np.ma.masked_invalid(values)
+                yield row, col, values
+
+    def render(self):
+        lut = colormap(COLORMAPS[self.name])
+        output = np.zeros(self.shape + (4,), dtype=np.uint8)
+        for row, col, values in self.blocks():
+            levels = np.clip(np.round((np.ma.getdata(values) + 1) * 127.5), 0, 255).astype(np.uint8)
+            pixels = lut[levels]
+            pixels[np.ma.getmaskarray(values)] = 0
+            output[row:row + values.shape[0], col:col + values.shape[1]] = pixels
+        return Image.fromarray(output, "RGBA")
+
+    def write_geotiff(self, filename):
+        height, width = self.shape
+        profile = {
+            "driver": "GTiff", "width": width, "height": height, "count": 1, "dtype": "float32",
+            "crs": self.crs, "transform": self.transform, "nodata": np.nan,
+            "tiled": True, "blockxsize": 256, "blockysize": 256, "compress": "deflate", "predictor": 3,
+        }
+        with rasterio.open(filename, "w", **profile) as dst:
+            for row, col, values in self.blocks():
+                dst.write(values.filled(np.nan).astype(np.float32), 1,
+                          window=windows.Window(col, row, values.shape[1], values.shape[0]))
@@ -0,0 +1,150 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status);
+"""
+
+COLUMNS = "id, key, status, result, error, created, finished"
+
+
+class Job:
+    def __init__(self, id, key, status, result=None, error=None, created=None, finished=None):
+        self.id = id
+        self.key = key
+        self.status = status
+        self.result = result
+        self.error = error
+        self.created = created
+        self.finished = finished
+
+    @classmethod
+    def from_row(cls, row):
+        id, key, status, result, error, created, finished = row
+        return cls(id, key, status, None if result is None else json.loads(result), error, created, finished)
+
+    def to_dict(self):
+        job = {"job": self.id, "status": self.status}
+        if self.status == "done":
+            job["result"] = self.result
+        elif self.status == "failed":
+            job["error"] = self.error
+        return job
+
+
+class JobQueue:
+    # Jobs run on this process's executor, but their state lives in SQLite, so a poll
+    # that reaches another worker process (or an identical submit, which reuses the
+    # in-flight job) sees the same job. Results must be JSON-serializable.
+    def __init__(self, filename, max_workers=4, ttl=600, poll_interval=0.25):
+        self.filename = filename
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+        self._lock = threading.Lock()
+        # Job id -> event, for the jobs running in this process.
+        self._done = {}
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self._db = self._connect()
+        self._db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.filename, check_same_thread=False, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def after_fork(self):
+        # The parent's connection, executor threads and running jobs stay in the parent.
+        self._lock = threading.Lock()
+        self._done = {}
+        self._db = self._connect()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+
+    def submit(self, key, fn, *args):
+        key = json.dumps(key)
+        with self._lock:
+            # An immediate transaction, so two processes can't both start a job for one key.
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._expire()
+                row = self._db.execute(
+                    f"SELECT {COLUMNS} FROM jobs WHERE key = ? AND status != 'failed' ORDER BY created DESC LIMIT 1",
+                    (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("COMMIT")
+                    return Job.from_row(row), False
+                job = Job(uuid.uuid4().hex, key, "pending", created=time.time())
+                self._db.execute("INSERT INTO jobs (id, key, status, created) VALUES (?, ?, ?, ?)",
+                                 (job.id, job.key, job.status, job.created))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._done[job.id] = threading.Event()
+        self.executor.submit(self._run, job, fn, args)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            row = self._db.execute(f"SELECT {COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row is not None else None
+
+    def wait(self, job_id, timeout):
+        # Jobs of this process signal when they finish; others are polled in the database.
+        done = self._done.get(job_id)
+        if done is not None:
+            done.wait(timeout)
+            return self.get(job_id)
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job.status in ("done", "failed") or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _run(self, job, fn, args):
+        self._update(job.id, status="running")
+        try:
+            result = json.dumps(fn(*args))
+            self._update(job.id, status="done", result=result, finished=time.time())
+        except Exception as e:
+            # A failed job is not reused, so the next identical request retries.
+            self._update(job.id, status="failed", error=str(e), finished=time.time())
+        finally:
+            with self._lock:
+                done = self._done.pop(job.id, None)
+            if done is not None:
+                done.set()
+
+    def _expire(self):
+        now = time.time()
+        # A job still unfinished after ttl belonged to a worker that died or hung.
+        self._db.execute("UPDATE jobs SET status = 'failed', error = 'Job did not finish.', finished = ? "
+                         "WHERE finished IS NULL AND created < ?", (now, now - self.ttl))
+        self._db.execute("DELETE FROM jobs WHERE finished < ?", (now - self.ttl,))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
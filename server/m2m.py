@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import DOWNLOADED_BYTES, stage
+
+
+SERVICE_URL = "https://m2m.cr.usgs.gov/api/api/json/stable/"
+
+
+class M2MError(Exception):
+    def __init__(self, error_code, message):
+        super().__init__(f"{error_code}: {message}")
+        self.error_code = error_code
+
+
+class M2MSession:
+    # M2M API keys are valid for two hours; refresh a little before that.
+    def __init__(self, username, token, service_url=SERVICE_URL, pool_size=10, token_ttl=6600, timeout=60):
+        self.username = username
+        self.token = token
+        self.service_url = service_url
+        self.token_ttl = token_ttl
+        self.timeout = timeout
+
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._api_key = None
+        self._expires_at = 0
+
+    def _post(self, endpoint, data, api_key=None):
+        headers = {'X-Auth-Token': api_key} if api_key else {}
+        with stage(endpoint):
+            response = self.http.post(self.service_url + endpoint, json.dumps(data), headers=headers, timeout=self.timeout)
+        DOWNLOADED_BYTES.inc(len(response.content), source="m2m")
+        if response.status_code in (401, 403):
+            raise M2MError("AUTH_UNAUTHORIZED", f"HTTP {response.status_code}")
+        response.raise_for_status()
+        output = response.json()
+        if 'errorCode' in output and output['errorCode'] is not None:
+            raise M2MError(output['errorCode'], output.get('errorMessage'))
+        return output['data']
+
+    def get_api_key(self):
+        with self._lock:
+            if self._api_key is None or time.monotonic() >= self._expires_at:
+                self._api_key = self._post("login-token", {'username': self.username, 'token': self.token})
+                self._expires_at = time.monotonic() + self.token_ttl
+                print("API Key obtained.")
+            return self._api_key
+
+    def invalidate(self, api_key):
+        # Only drop the key if nobody refreshed it in the meantime.
+        with self._lock:
+            if self._api_key == api_key:
+                self._api_key = None
+
+    def send_request(self, endpoint, data):
+        api_key = self.get_api_key()
+        try:
+            return self._post(endpoint, data, api_key)
+        except M2MError as e:
+            if not e.error_code.startswith("AUTH_"):
+                raise
+            self.invalidate(api_key)
+            return self._post(endpoint, data, self.get_api_key())
+
+    def logout(self):
+        with self._lock:
+            if self._api_key is None:
+                return
+            try:
+                self._post("logout", {}, self._api_key)
+                print("Logged out.")
+            finally:
+                self._api_key = None
+
+    def close(self):
+        try:
+            self.logout()
+        except (requests.exceptions.RequestException, M2MError) as e:
+            print(f"Error logging out: {e}")
+        self.http.close()
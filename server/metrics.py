@@ -0,0 +1,341 @@
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import file_lock, write_atomic
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(values, other):
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted((self.snapshot() if values is None else values).items()):
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, values=None, labels=None):
+        # Gauges of several processes are not added up; their keys end with a pid label.
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted((self.snapshot() if values is None else values).items()):
+            lines.append(f"{self.name}{format_labels(labels or self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # Per label set: [counts per bucket (not cumulative) plus one overflow bucket, sum].
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, _ = entry = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            counts[index] += 1
+            entry[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {key: [list(counts), total] for key, (counts, total) in self._values.items()}
+
+    @staticmethod
+    def merge(values, other):
+        for key, (counts, total) in other.items():
+            if key in values:
+                values[key] = [[a + b for a, b in zip(values[key][0], counts)], values[key][1] + total]
+            else:
+                values[key] = [list(counts), total]
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted((self.snapshot() if values is None else values).items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, labels=()):
+        metric = Gauge(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def after_fork(self):
+        # What the parent counted before forking (warmup) would otherwise be counted
+        # again by every worker. Gauges keep their values; they are reported per process.
+        for metric in self.metrics:
+            metric._lock = threading.Lock()
+            if not isinstance(metric, Gauge):
+                metric._values = {}
+
+    def snapshot(self):
+        return {metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+                for metric in self.metrics}
+
+    def render(self, directory=None):
+        # With a directory, the metrics of every worker process: the snapshots the others
+        # last wrote there (see MetricsWriter) plus this process's current values.
+        if directory is None:
+            return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+        snapshots = read_snapshots(directory)
+        snapshots[str(os.getpid())] = self.snapshot()
+        lines = []
+        for metric in self.metrics:
+            values = {}
+            for pid, snapshot in sorted(snapshots.items()):
+                entries = {tuple(key): value for key, value in snapshot.get(metric.name, [])}
+                if isinstance(metric, Gauge):
+                    values.update({key + (pid,): value for key, value in entries.items()})
+                else:
+                    metric.merge(values, entries)
+            if isinstance(metric, Gauge):
+                lines.extend(metric.render(values, metric.labels + ("pid",)))
+            else:
+                lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
+
+
+DEAD_SNAPSHOT = "dead.json"
+
+
+def snapshot_filename(directory, pid):
+    return os.path.join(directory, f"{pid}.json")
+
+
+def read_snapshots(directory):
+    # pid (or "dead") -> snapshot, for every snapshot file except this process's own.
+    snapshots = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return snapshots
+    for name in names:
+        pid, ext = os.path.splitext(name)
+        if ext != ".json" or pid == str(os.getpid()):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshots[pid] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def clear_snapshots(directory):
+    # Snapshots of an earlier server run would otherwise be counted again.
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                os.unlink(os.path.join(directory, name))
+
+
+def mark_process_dead(directory, pid, registry):
+    # Counters and histograms of a worker that exited are folded into dead.json, so the
+    # totals never go down; its gauges are dropped.
+    filename = snapshot_filename(directory, pid)
+    with file_lock(os.path.join(directory, "dead.lock")):
+        try:
+            with open(filename) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return
+        dead = {}
+        try:
+            with open(os.path.join(directory, DEAD_SNAPSHOT)) as f:
+                dead = json.load(f)
+        except (OSError, ValueError):
+            pass
+        merged = {}
+        for metric in registry.metrics:
+            if isinstance(metric, Gauge):
+                continue
+            values = {tuple(key): value for key, value in dead.get(metric.name, [])}
+            metric.merge(values, {tuple(key): value for key, value in snapshot.get(metric.name, [])})
+            merged[metric.name] = [[list(key), value] for key, value in values.items()]
+        write_atomic(os.path.join(directory, DEAD_SNAPSHOT), json.dumps(merged).encode())
+        os.unlink(filename)
+
+
+class MetricsWriter:
+    # Writes this process's metrics to directory every interval seconds, for whichever
+    # worker answers the next /metrics scrape. before_write can update gauges first.
+    def __init__(self, registry, directory, interval=5.0, before_write=None):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.before_write = before_write
+        self._thread = None
+
+    def write(self):
+        if self.before_write is not None:
+            self.before_write()
+        write_atomic(snapshot_filename(self.directory, os.getpid()), json.dumps(self.registry.snapshot()).encode())
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+            self._thread.start()
+
+    def after_fork(self):
+        # Every forked worker writes its own snapshot; the parent's thread didn't survive.
+        self._thread = None
+        self.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Error writing metrics: {e}")
+            time.sleep(self.interval)
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram("landsat_stage_seconds", "Time spent in each stage of the scene pipeline.", ["stage"])
+REQUEST_SECONDS = registry.histogram("http_request_duration_seconds", "Time to handle an API request.",
+                                     ["method", "endpoint", "status"])
+DOWNLOADED_BYTES = registry.counter("landsat_downloaded_bytes_total", "Bytes received from outside services.", ["source"])
+CACHE_LOOKUPS = registry.counter("cache_lookups_total", "Cache lookups by cache and result.", ["cache", "result"])
+STARTUP_SECONDS = registry.gauge("app_startup_seconds", "Time to import and warm up the app.", ["phase"])
+MEMORY_BYTES = registry.gauge("process_memory_bytes", "Memory of this process: rss, pss (shared pages split "
+                              "between the processes using them) and private.", ["kind"])
+
+
+class RequestTimings:
+    # Stage durations of one API request, for the Server-Timing header. Downloads run in
+    # other threads, so adding is locked.
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            total, count = self._stages.get(name, (0.0, 0))
+            self._stages[name] = (total + seconds, count + 1)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        # Repeated stages are summed; parallel downloads can therefore add up to more than the total.
+        with self._lock:
+            stages = list(self._stages.items())
+        entries = []
+        for name, (total, count) in stages:
+            entry = f"{name};dur={total * 1000:.1f}"
+            entries.append(entry + f';desc="{count}x"' if count > 1 else entry)
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _request_timings.set(timings)
+
+
+def end_request(token):
+    _request_timings.reset(token)
+
+
+def record(name, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def count_cache(cache, hit):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
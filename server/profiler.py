@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+
+def collapse(frame, max_depth=64):
+    # One "file:function;file:function" line per stack, outermost first, as used by flame graph tools.
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    # Samples the stacks of in-flight request threads from a background thread. The
+    # samples of a request are only written out if it turned out slower than threshold.
+    def __init__(self, threshold, directory, interval=0.005, max_depth=64):
+        self.threshold = threshold
+        self.directory = directory
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+
+    def start(self, thread_id=None):
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, name, duration, thread_id=None):
+        with self._lock:
+            samples = self._active.pop(thread_id or threading.get_ident(), None)
+        if samples is None or duration < self.threshold:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        filename = os.path.join(self.directory, f"{stamp}_{name.strip('/').replace('/', '_') or 'root'}.folded")
+        with open(filename, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Slow request {name} took {duration:.2f}s, profile written to {filename}")
+        return filename
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[collapse(frame, self.max_depth)] += 1
+            del frames
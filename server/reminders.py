@@ -0,0 +1,196 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from utils import file_lock, write_atomic
+
+
+def reminder_paths(reminder):
+    # Reminders are keyed by the WRS-2 paths of the selected location, joined with "-".
+    return [path for path in str(reminder.get("key") or "").split("-") if path.strip()]
+
+
+class JSONReminderStore:
+    # Same layout as the reminders collection: {email: {"all": [reminder, ...]}}. Updates
+    # read, change and rewrite a whole file, so they hold a file lock against other
+    # worker processes as well as the thread lock.
+    def __init__(self, filename):
+        self.filename = filename
+        self.sent_filename = os.path.splitext(filename)[0] + ".sent.json"
+        self.lock_filename = filename + ".lock"
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+
+    def _read(self, filename):
+        try:
+            with open(filename) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def load(self):
+        for user, document in self._read(self.filename).items():
+            for reminder in document.get("all", []):
+                yield user, reminder
+
+    def save(self, user, reminders):
+        with self._lock, file_lock(self.lock_filename):
+            documents = self._read(self.filename)
+            documents[user] = {"all": reminders}
+            write_atomic(self.filename, json.dumps(documents).encode())
+
+    def sent(self):
+        return {tuple(entry) for entry in self._read(self.sent_filename).get("sent", [])}
+
+    def mark_sent(self, entries, today=None):
+        # Entries dated before today (an ISO date) are dropped; due() never returns them again.
+        with self._lock, file_lock(self.lock_filename):
+            sent = {entry for entry in self.sent() | {tuple(entry) for entry in entries}
+                    if today is None or entry[2] >= today}
+            write_atomic(self.sent_filename, json.dumps({"sent": sorted(sent)}).encode())
+
+
+class SQLiteReminderStore:
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS reminders (user TEXT NOT NULL, reminder TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS reminders_user ON reminders (user);
+            CREATE TABLE IF NOT EXISTS sent (user TEXT NOT NULL, key TEXT NOT NULL, date TEXT NOT NULL,
+                                             PRIMARY KEY (user, key, date));
+        """)
+
+    def load(self):
+        with self._lock:
+            rows = self._db.execute("SELECT user, reminder FROM reminders").fetchall()
+        for user, reminder in rows:
+            yield user, json.loads(reminder)
+
+    def save(self, user, reminders):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM reminders WHERE user = ?", (user,))
+            self._db.executemany("INSERT INTO reminders (user, reminder) VALUES (?, ?)",
+                                 [(user, json.dumps(reminder)) for reminder in reminders])
+
+    def sent(self):
+        with self._lock:
+            return set(self._db.execute("SELECT user, key, date FROM sent").fetchall())
+
+    def mark_sent(self, entries, today=None):
+        with self._lock, self._db:
+            if today is not None:
+                self._db.execute("DELETE FROM sent WHERE date < ?", (today,))
+            self._db.executemany("INSERT OR IGNORE INTO sent (user, key, date) VALUES (?, ?, ?)", entries)
+
+    def after_fork(self):
+        # SQLite connections must not be used across fork; the parent's is left alone.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.filename, check_same_thread=False)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_reminder_store(filename):
+    if filename.endswith((".db", ".sqlite", ".sqlite3")):
+        return SQLiteReminderStore(filename)
+    return JSONReminderStore(filename)
+
+
+class ReminderScheduler:
+    def __init__(self, store, schedule, notify, lead_days=1, interval=3600, lock_filename=None):
+        self.store = store
+        self.schedule = schedule
+        self.notify = notify
+        self.lead_days = lead_days
+        self.interval = interval
+        # Runs in different worker processes take turns on this file, so each due
+        # reminder is only sent once.
+        self.lock_filename = lock_filename
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def due(self, now=None):
+        current_time = now or datetime.now(timezone.utc)
+        reminders = list(self.store.load())
+
+        # One batched schedule lookup for every distinct path, however many reminders share it.
+        paths = sorted({path for _, reminder in reminders for path in reminder_paths(reminder)})
+        dates = self.schedule.next_acquisitions(paths, current_time) if paths else []
+        if dates is None:
+            return None
+        next_dates = {}
+        for path, (l8, l9) in zip(paths, dates):
+            for satellite, date in (("landsat_8", l8), ("landsat_9", l9)):
+                if date is None:
+                    continue
+                date = datetime.strptime(date, "%m/%d/%Y").date()
+                if path not in next_dates or date < next_dates[path][0]:
+                    next_dates[path] = (date, satellite)
+
+        today = current_time.date()
+        notifications = []
+        for user, reminder in reminders:
+            candidates = [(next_dates[path], path) for path in reminder_paths(reminder) if path in next_dates]
+            if not candidates:
+                continue
+            (date, satellite), path = min(candidates)
+            # Remind lead_days ahead; a scheduler that was down catches up until the day itself.
+            if 0 <= (date - today).days <= self.lead_days:
+                notifications.append({
+                    "user": user,
+                    "key": reminder.get("key"),
+                    "latitude": reminder.get("latitude"),
+                    "longitude": reminder.get("longitude"),
+                    "path": path,
+                    "satellite": satellite,
+                    "date": date.isoformat(),
+                })
+        return notifications
+
+    def run_once(self, now=None):
+        with self._lock:
+            if self.lock_filename is None:
+                return self._send_due(now)
+            with file_lock(self.lock_filename):
+                return self._send_due(now)
+
+    def _send_due(self, now):
+        notifications = self.due(now)
+        if not notifications:
+            return []
+        sent = self.store.sent()
+        pending = [notification for notification in notifications
+                   if (notification["user"], notification["key"], notification["date"]) not in sent]
+        if pending:
+            self.notify(pending)
+            today = (now or datetime.now(timezone.utc)).date().isoformat()
+            self.store.mark_sent([(notification["user"], notification["key"], notification["date"])
+                                  for notification in pending], today)
+        return pending
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Reminder run failed: {e}")
+            time.sleep(self.interval)
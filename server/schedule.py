@@ -0,0 +1,211 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import requests
+
+from metrics import DOWNLOADED_BYTES, stage
+from utils import write_atomic
+
+
+CYCLES_URL = "https://landsat.usgs.gov/sites/default/files/landsat_acq/assets/json/cycles_full.json"
+
+# Number of days of January 2024 scanned to find the cycle day of each path.
+SCAN_DAYS = {"landsat_8": 16, "landsat_9": 31}
+
+CYCLE_DAYS = 16
+MAX_PATH = 251
+
+
+def normalize_path(path):
+    path = str(path).strip()
+    return str(int(path)) if path.isdigit() else path
+
+
+def format_date(date):
+    return f"{date.month}/{date.day}/{date.year}"
+
+
+def build_index(data):
+    index = {}
+    for satellite, scan_days in SCAN_DAYS.items():
+        satellite_data = data[satellite]
+        dates = {date: int(info["cycle"]) for date, info in satellite_data.items() if "cycle" in info}
+        paths = {}
+        for i in range(1, scan_days + 1):
+            path_info = satellite_data.get(f"1/{i}/2024")
+            if not path_info:
+                continue
+            for path in path_info.get("path", "").split(","):
+                if path.strip():
+                    paths.setdefault(normalize_path(path), int(path_info["cycle"]))
+
+        # Path-by-cycle-day matrix for batch lookups; row 0 stays empty for unknown paths.
+        matrix = np.zeros((MAX_PATH + 1, CYCLE_DAYS + 1), dtype=bool)
+        for path, cycle in paths.items():
+            if path.isdigit() and int(path) <= MAX_PATH:
+                matrix[int(path), cycle] = True
+        index[satellite] = {"dates": dates, "paths": paths, "matrix": matrix}
+    return index
+
+
+class AcquisitionSchedule:
+    def __init__(self, cache_dir, url=CYCLES_URL, refresh_interval=6 * 3600, timeout=30):
+        self.url = url
+        self.filename = os.path.join(cache_dir, "cycles_full.json")
+        self.meta_filename = self.filename + ".meta"
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.http = requests.Session()
+
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._index = None
+        self._checked_at = 0
+        self._refreshing = False
+
+    def after_fork(self):
+        # Don't share pooled connections, locks held by the parent's threads or an
+        # in-progress background refresh with the parent process.
+        self.http = requests.Session()
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+
+    def _load_from_disk(self):
+        if not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, "rb") as f:
+                data = json.loads(f.read())
+            self._index = build_index(data)
+            self._checked_at = os.path.getmtime(self.meta_filename if os.path.exists(self.meta_filename) else self.filename)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading cached acquisition cycles: {e}")
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_filename) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, response):
+        meta = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+        write_atomic(self.meta_filename, json.dumps(meta).encode())
+
+    def revalidate(self):
+        headers = {}
+        if self._index is not None:
+            meta = self._read_meta()
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            with stage("cycles"):
+                response = self.http.get(self.url, headers=headers, timeout=self.timeout)
+            DOWNLOADED_BYTES.inc(len(response.content), source="cycles")
+            if response.status_code == 304:
+                self._checked_at = time.time()
+                # The meta file's mtime records the check across restarts; rewrite it if it is gone.
+                if os.path.exists(self.meta_filename):
+                    os.utime(self.meta_filename)
+                else:
+                    self._write_meta(response)
+                return
+            response.raise_for_status()
+            index = build_index(response.json())
+        except (requests.exceptions.RequestException, OSError, ValueError, KeyError) as e:
+            print(f"Error fetching data: {e}")
+            return
+
+        write_atomic(self.filename, response.content)
+        self._write_meta(response)
+        with self._lock:
+            self._index = index
+            self._checked_at = time.time()
+
+    def _revalidate_in_background(self):
+        try:
+            self.revalidate()
+        finally:
+            self._refreshing = False
+
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._load_from_disk()
+        if self._index is None:
+            # Nothing cached yet, so the first request has to wait for USGS.
+            with self._fetch_lock:
+                if self._index is None:
+                    self.revalidate()
+            return self._index
+        with self._lock:
+            if not self._refreshing and time.time() - self._checked_at > self.refresh_interval:
+                self._refreshing = True
+                threading.Thread(target=self._revalidate_in_background, daemon=True).start()
+            return self._index
+
+    def next_acquisition(self, path, now=None):
+        index = self.index()
+        if index is None:
+            return None
+
+        current_time = now or datetime.now(timezone.utc)
+        path_date = format_date(current_time)
+        path = normalize_path(path)
+
+        try:
+            today_cycle_l8 = index["landsat_8"]["dates"][path_date]
+            today_cycle_l9 = index["landsat_9"]["dates"][path_date]
+        except KeyError:
+            print("Error: Path date not found in data.")
+            return None
+
+        def find_next_acquisition(satellite_index, today_cycle):
+            cycle = satellite_index["paths"].get(path)
+            if cycle is None:
+                return None
+            diff = cycle - today_cycle
+            if diff < 0:
+                diff += CYCLE_DAYS
+            return format_date(current_time + timedelta(days=diff))
+
+        next_acq_l8 = find_next_acquisition(index["landsat_8"], today_cycle_l8)
+        next_acq_l9 = find_next_acquisition(index["landsat_9"], today_cycle_l9)
+
+        return next_acq_l8, next_acq_l9
+
+    def next_acquisitions(self, paths, now=None):
+        index = self.index()
+        if index is None:
+            return None
+
+        current_time = now or datetime.now(timezone.utc)
+        path_date = format_date(current_time)
+        try:
+            today_cycles = {satellite: index[satellite]["dates"][path_date] for satellite in SCAN_DAYS}
+        except KeyError:
+            print("Error: Path date not found in data.")
+            return None
+
+        path_ids = np.zeros(len(paths), dtype=np.intp)
+        for i, path in enumerate(paths):
+            path = normalize_path(path)
+            if path.isdigit() and int(path) <= MAX_PATH:
+                path_ids[i] = int(path)
+
+        dates = np.array([format_date(current_time + timedelta(days=diff)) for diff in range(CYCLE_DAYS)] + [None], dtype=object)
+        results = {}
+        for satellite in ("landsat_8", "landsat_9"):
+            matrix = index[satellite]["matrix"]
+            diffs = (np.arange(matrix.shape[1]) - today_cycles[satellite]) % CYCLE_DAYS
+            next_diff = np.where(matrix[path_ids], diffs, CYCLE_DAYS).min(axis=1)
+            results[satellite] = dates[next_diff]
+
+        return list(zip(results["landsat_8"].tolist(), results["landsat_9"].tolist()))
@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import threading
+
+from utils import lazy_import, write_atomic
+
+brotli = lazy_import("brotli")
+
+
+# Vite writes bundles to assets/ with an 8 character content hash; files copied from
+# client/public keep their names and live in subdirectories of assets/.
+HASHED_ASSET = re.compile(r"^assets/[^/]+-[A-Za-z0-9_-]{8}\.\w+$")
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/manifest+json",
+                      "application/xml", "image/svg+xml", "application/wasm")
+
+# Preferred first; the file suffix of each pre-built variant.
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+
+def is_compressible(mimetype):
+    return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def accepted_encodings(header):
+    # Accept-Encoding codings with a non-zero q value.
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class StaticFile:
+    def __init__(self, path, mimetype, cache_control):
+        self.path = path
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        # Content-Encoding ("identity" for the original) -> (etag, filename or None, data or None).
+        self.variants = {}
+
+
+class StaticFiles:
+    # An in-memory manifest of the built client, made once: every file with its type,
+    # ETag, cache policy and compressed variants. Small files are kept in memory, so
+    # serving them touches neither the disk nor the file system metadata.
+    def __init__(self, root, index="index.html", max_age=3600, max_inline_bytes=1024 ** 2, compress_missing=True):
+        self.root = root
+        self.index = index
+        self.max_age = max_age
+        self.max_inline_bytes = max_inline_bytes
+        self.compress_missing = compress_missing
+        self._lock = threading.Lock()
+        self._files = None
+
+    def cache_control(self, name):
+        if HASHED_ASSET.match(name):
+            return "public, max-age=31536000, immutable"
+        if name == self.index:
+            # Always revalidate, so a new build's bundle names are picked up at once.
+            return "no-cache"
+        return f"public, max-age={self.max_age}"
+
+    def _variant(self, filename, data):
+        etag = hashlib.sha256(data).hexdigest()[:32]
+        if len(data) <= self.max_inline_bytes:
+            return etag, None, data
+        return etag, filename, None
+
+    def build(self):
+        files = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(tuple(ENCODINGS.values())):
+                    continue
+                filename = os.path.join(directory, name)
+                relative = os.path.relpath(filename, self.root).replace(os.sep, "/")
+                mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                entry = StaticFile(relative, mimetype, self.cache_control(relative))
+                with open(filename, "rb") as f:
+                    data = f.read()
+                entry.variants["identity"] = self._variant(filename, data)
+                for encoding, suffix in ENCODINGS.items():
+                    if os.path.exists(filename + suffix):
+                        with open(filename + suffix, "rb") as f:
+                            entry.variants[encoding] = self._variant(filename + suffix, f.read())
+                    elif self.compress_missing and is_compressible(mimetype) and len(data) <= self.max_inline_bytes \
+                            and (encoding == "gzip" or brotli is not None):
+                        compressed = compress(data, encoding)
+                        if len(compressed) < len(data):
+                            entry.variants[encoding] = hashlib.sha256(compressed).hexdigest()[:32], None, compressed
+                files[relative] = entry
+        return files
+
+    def files(self):
+        if self._files is None:
+            with self._lock:
+                if self._files is None:
+                    self._files = self.build() if os.path.isdir(self.root) else {}
+        return self._files
+
+    def lookup(self, path):
+        # The file for a URL path; anything else gets the single-page app's index.
+        files = self.files()
+        return files.get(path) or files.get(self.index)
+
+    @staticmethod
+    def choose(entry, accept_encoding):
+        accepted = accepted_encodings(accept_encoding) if accept_encoding else set()
+        for encoding in ENCODINGS:
+            if encoding in entry.variants and (encoding in accepted or "*" in accepted):
+                return encoding
+        return "identity"
+
+
+def precompress(root, min_bytes=1024):
+    # Writes .br (if the brotli package is installed) and .gz files next to every
+    # compressible file of a build, for example after `npm run build`.
+    written = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(tuple(ENCODINGS.values())):
+                continue
+            mimetype = mimetypes.guess_type(name)[0] or ""
+            filename = os.path.join(directory, name)
+            if not is_compressible(mimetype) or os.path.getsize(filename) < min_bytes:
+                continue
+            with open(filename, "rb") as f:
+                data = f.read()
+            for encoding, suffix in ENCODINGS.items():
+                if encoding == "br" and brotli is None:
+                    continue
+                compressed = compress(data, encoding)
+                if len(compressed) < len(data):
+                    write_atomic(filename + suffix, compressed)
+                    written += 1
+    return written
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python static_files.py <build directory>")
+    print(f"Wrote {precompress(sys.argv[1])} compressed files.")
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+
+
+class PositionBroadcaster:
+    def __init__(self, compute, interval=1.0, queue_size=2, keepalive=15, max_subscribers=None, poll_interval=5,
+                 retry=60):
+        self.compute = compute
+        self.interval = interval
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        # Each open stream holds a server thread; past max_subscribers, clients are told
+        # to poll every poll_interval seconds and to try the stream again after retry.
+        self.max_subscribers = max_subscribers
+        self.poll_interval = poll_interval
+        self.retry = retry
+
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._ticker = None
+        self._latest = None
+
+    def subscribe(self):
+        # None when max_subscribers streams are already open.
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                return None
+            if self._latest is not None:
+                subscriber.put_nowait(self._latest)
+            self._subscribers.add(subscriber)
+            if self._ticker is None:
+                self._ticker = threading.Thread(target=self._run, daemon=True)
+                self._ticker.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _publish(self, message):
+        with self._lock:
+            self._latest = message
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            # Slow clients only ever get the newest positions; stale ones are dropped.
+            while True:
+                try:
+                    subscriber.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._ticker = None
+                    self._latest = None
+                    return
+            started = time.monotonic()
+            try:
+                data = self.compute()
+                if data is not None:
+                    self._publish(f"data: {json.dumps(data)}\n\n")
+            except Exception as e:
+                print(f"Error computing satellite positions: {e}")
+            time.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+    def rejected_events(self):
+        # A "poll" event, then the stream ends. Clients that ignore it still wait the
+        # retry before their EventSource reconnects.
+        poll = json.dumps({"interval": self.poll_interval, "retry": self.retry})
+        yield f"retry: {int(self.retry * 1000)}\nevent: poll\ndata: {poll}\n\n"
+        with self._lock:
+            latest = self._latest
+        if latest is not None:
+            yield latest
+
+    def events(self, subscriber):
+        if subscriber is None:
+            yield from self.rejected_events()
+            return
+        try:
+            while True:
+                try:
+                    yield subscriber.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+class AsyncPositionBroadcaster:
+    # PositionBroadcaster for the asyncio app: a stream is a queue, not a thread, so
+    # there is no subscriber limit. compute is blocking and runs in the default executor.
+    def __init__(self, compute, interval=1.0, queue_size=2, keepalive=15):
+        self.compute = compute
+        self.interval = interval
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+
+        self._subscribers = set()
+        self._ticker = None
+        self._latest = None
+
+    def subscribe(self):
+        subscriber = asyncio.Queue(maxsize=self.queue_size)
+        if self._latest is not None:
+            subscriber.put_nowait(self._latest)
+        self._subscribers.add(subscriber)
+        if self._ticker is None:
+            self._ticker = asyncio.get_running_loop().create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    def _publish(self, message):
+        self._latest = message
+        for subscriber in self._subscribers:
+            # Slow clients only ever get the newest positions; stale ones are dropped.
+            if subscriber.full():
+                subscriber.get_nowait()
+            subscriber.put_nowait(message)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._subscribers:
+            started = time.monotonic()
+            try:
+                data = await loop.run_in_executor(None, self.compute)
+                if data is not None:
+                    self._publish(f"data: {json.dumps(data)}\n\n")
+            except Exception as e:
+                print(f"Error computing satellite positions: {e}")
+            await asyncio.sleep(max(0, self.interval - (time.monotonic() - started)))
+        self._ticker = None
+        self._latest = None
+
+    async def events(self, subscriber):
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,144 @@
+import io
+import json
+import math
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+
+TILE_SIZE = 256
+
+
+def mercator(longitude, latitude):
+    # Normalized Web Mercator: x and y in [0, 1], y growing southwards like tile rows.
+    latitude = max(min(latitude, 85.05112878), -85.05112878)
+    x = (longitude + 180) / 360
+    y = (1 - math.log(math.tan(math.radians(latitude)) + 1 / math.cos(math.radians(latitude))) / math.pi) / 2
+    return x, y
+
+
+def bounds_from_geometry(geometry):
+    points = []
+
+    def collect(coordinates):
+        if coordinates and isinstance(coordinates[0], (int, float)):
+            points.append(coordinates)
+        else:
+            for item in coordinates:
+                collect(item)
+
+    collect(geometry.get("coordinates", []))
+    if not points:
+        return None
+    longitudes = [point[0] for point in points]
+    latitudes = [point[1] for point in points]
+    return [min(latitudes), min(longitudes), max(latitudes), max(longitudes)]
+
+
+def empty_tile():
+    img_io = io.BytesIO()
+    Image.new("RGBA", (TILE_SIZE, TILE_SIZE)).save(img_io, "PNG")
+    return img_io.getvalue()
+
+
+class TilePyramid:
+    def __init__(self, image_cache, max_memory_bytes=512 * 1024 ** 2):
+        self.image_cache = image_cache
+        self.max_memory_bytes = max_memory_bytes
+        self.empty_tile = empty_tile()
+
+        self._lock = threading.Lock()
+        self._levels = OrderedDict()
+
+    def save_bounds(self, key, bounds):
+        self.image_cache.put(key, json.dumps({"bounds": bounds}).encode(), "json")
+
+    def load_bounds(self, key):
+        f = self.image_cache.open(key, "json")
+        if f is None:
+            return None
+        with f:
+            return json.load(f)["bounds"]
+
+    def max_zoom(self, key, bounds):
+        master = self.image_cache.open(key)
+        if master is None:
+            return None
+        with master:
+            width, _ = Image.open(master).size
+        x0, _ = mercator(bounds[1], bounds[2])
+        x1, _ = mercator(bounds[3], bounds[0])
+        return max(0, math.ceil(math.log2(width / ((x1 - x0) * TILE_SIZE))))
+
+    def _level(self, key, level):
+        # Level 0 is the processed scene; level n is half the size of level n - 1.
+        cache_key = (key, level)
+        with self._lock:
+            if cache_key in self._levels:
+                self._levels.move_to_end(cache_key)
+                return self._levels[cache_key]
+
+        level_key = key if level == 0 else f"{key}-level{level}"
+        f = self.image_cache.open(level_key)
+        if f is not None:
+            with f:
+                img = Image.open(f)
+                img.load()
+        elif level == 0:
+            return None
+        else:
+            parent = self._level(key, level - 1)
+            if parent is None:
+                return None
+            img = parent.reduce(2)
+            img_io = io.BytesIO()
+            img.save(img_io, "PNG", compress_level=1)
+            self.image_cache.put(level_key, img_io.getvalue())
+
+        with self._lock:
+            self._levels[cache_key] = img
+            # Keep decoded levels under the memory budget, but always keep the newest one.
+            while len(self._levels) > 1 and sum(level.width * level.height * 4 for level in self._levels.values()) > self.max_memory_bytes:
+                self._levels.popitem(last=False)
+        return img
+
+    def render(self, key, bounds, z, x, y):
+        tile_key = f"{key}-tile-{z}-{x}-{y}"
+        cached = self.image_cache.open(tile_key)
+        if cached is not None:
+            with cached:
+                return cached.read()
+
+        south, west, north, east = bounds
+        scene_x0, scene_y0 = mercator(west, north)
+        scene_x1, scene_y1 = mercator(east, south)
+        n = 2 ** z
+        tile_x0, tile_y0, tile_x1, tile_y1 = x / n, y / n, (x + 1) / n, (y + 1) / n
+        if tile_x1 <= scene_x0 or tile_x0 >= scene_x1 or tile_y1 <= scene_y0 or tile_y0 >= scene_y1:
+            return self.empty_tile
+
+        master = self._level(key, 0)
+        if master is None:
+            return None
+        width, height = master.size
+        # The image is stretched linearly in Mercator space, like a Leaflet ImageOverlay.
+        box = [
+            (tile_x0 - scene_x0) / (scene_x1 - scene_x0) * width,
+            (tile_y0 - scene_y0) / (scene_y1 - scene_y0) * height,
+            (tile_x1 - scene_x0) / (scene_x1 - scene_x0) * width,
+            (tile_y1 - scene_y0) / (scene_y1 - scene_y0) * height,
+        ]
+        level = 0
+        while (box[2] - box[0]) / 2 ** (level + 1) >= TILE_SIZE and min(width, height) // 2 ** (level + 1) > 0:
+            level += 1
+        img = self._level(key, level) if level else master
+        scale = img.size[0] / width
+        box = [value * scale for value in box]
+
+        tile = img.transform((TILE_SIZE, TILE_SIZE), Image.EXTENT, box, Image.BILINEAR, fillcolor=(0, 0, 0, 0))
+        img_io = io.BytesIO()
+        tile.save(img_io, "PNG")
+        data = img_io.getvalue()
+        self.image_cache.put(tile_key, data)
+        return data
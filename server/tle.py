@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from utils import write_atomic
+
+
+def tle_checksum(line):
+    total = 0
+    for char in line[:68]:
+        if char.isdigit():
+            total += int(char)
+        elif char == '-':
+            total += 1
+    return total % 10
+
+
+def validate_tle(lines, catalog_number):
+    if not lines or len(lines) != 3:
+        return False
+    name, line1, line2 = lines
+    if not name.strip() or len(line1) != 69 or len(line2) != 69:
+        return False
+    if not line1.startswith("1 ") or not line2.startswith("2 "):
+        return False
+    if not line1[2:7].strip().isdigit() or int(line1[2:7]) != int(catalog_number) or line1[2:7] != line2[2:7]:
+        return False
+    return line1[68].isdigit() and line2[68].isdigit() \
+        and int(line1[68]) == tle_checksum(line1) and int(line2[68]) == tle_checksum(line2)
+
+
+def tle_epoch(lines):
+    year = int(lines[1][18:20])
+    day = float(lines[1][20:32])
+    year += 2000 if year < 57 else 1900
+    return datetime(year, 1, 1, tzinfo=timezone.utc) + timedelta(days=day - 1)
+
+
+class TLEStore:
+    def __init__(self, cache_dir, fetch, max_age=12 * 3600, retry_interval=3600, missing_retry=10,
+                 missing_retry_max=300):
+        self.cache_dir = os.path.join(cache_dir, "tle")
+        self.fetch = fetch
+        self.max_age = max_age
+        self.retry_interval = retry_interval
+        # A catalog with no TLE at all is retried sooner: after missing_retry seconds,
+        # doubling with each failure up to missing_retry_max.
+        self.missing_retry = missing_retry
+        self.missing_retry_max = missing_retry_max
+
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._tles = {}
+        self._attempted_at = {}
+        self._failures = {}
+        # Every catalog number asked for, so the refresher retries ones that never loaded.
+        self._wanted = set()
+        self._refresher = None
+
+    def _filename(self, catalog_number):
+        return os.path.join(self.cache_dir, f"{catalog_number}.tle")
+
+    def _load_from_disk(self, catalog_number):
+        try:
+            with open(self._filename(catalog_number)) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+        if not validate_tle(lines, catalog_number):
+            print(f"Ignoring invalid cached TLE for {catalog_number}")
+            return None
+        return tuple(lines)
+
+    def refresh(self, catalog_number):
+        self._attempted_at[catalog_number] = time.time()
+        try:
+            lines = [line.rstrip() for line in self.fetch(catalog_number) if line.strip()]
+        except Exception as e:
+            print(f"Error fetching TLE for {catalog_number}: {e}")
+            return False
+        if not validate_tle(lines, catalog_number):
+            print(f"Rejected invalid TLE for {catalog_number}: {lines!r}")
+            return False
+
+        current = self._tles.get(catalog_number)
+        if current is not None and tle_epoch(lines) < tle_epoch(current):
+            return False
+        write_atomic(self._filename(catalog_number), "\n".join(lines).encode())
+        self._tles[catalog_number] = tuple(lines)
+        return True
+
+    def is_stale(self, catalog_number):
+        lines = self._tles.get(catalog_number)
+        if lines is None:
+            return True
+        age = (datetime.now(timezone.utc) - tle_epoch(lines)).total_seconds()
+        return age > self.max_age \
+            and time.time() - self._attempted_at.get(catalog_number, 0) > self.retry_interval
+
+    def get(self, catalog_number):
+        lines = self._tles.get(catalog_number)
+        if lines is None:
+            with self._lock:
+                self._wanted.add(catalog_number)
+                lines = self._tles.get(catalog_number)
+                if lines is None:
+                    lines = self._load_from_disk(catalog_number)
+                    if lines is not None:
+                        self._tles[catalog_number] = lines
+        if lines is None:
+            lines = self._fetch_missing(catalog_number)
+        self.start()
+        return lines
+
+    def _missing_due(self, catalog_number):
+        delay = min(self.missing_retry * 2 ** self._failures.get(catalog_number, 0), self.missing_retry_max)
+        return catalog_number not in self._tles \
+            and time.time() - self._attempted_at.get(catalog_number, 0) > delay
+
+    def _refresh_missing(self, catalog_number):
+        # Call with _fetch_lock held.
+        if not self._missing_due(catalog_number):
+            return
+        if self.refresh(catalog_number):
+            self._failures.pop(catalog_number, None)
+        else:
+            self._failures[catalog_number] = self._failures.get(catalog_number, 0) + 1
+
+    def _fetch_missing(self, catalog_number):
+        # Nothing cached yet, so one request waits for Celestrak. The others, and every
+        # request until the backoff after a failed attempt has passed, get None at once
+        # instead of queueing behind a fetch that may take the whole timeout.
+        if not self._missing_due(catalog_number):
+            return None
+        if not self._fetch_lock.acquire(blocking=False):
+            return None
+        try:
+            self._refresh_missing(catalog_number)
+            return self._tles.get(catalog_number)
+        finally:
+            self._fetch_lock.release()
+
+    def after_fork(self):
+        # The refresher thread and any lock it held stayed in the parent process.
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refresher = None
+
+    def start(self):
+        if self._refresher is None:
+            with self._lock:
+                if self._refresher is None:
+                    self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+                    self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            for catalog_number in list(self._tles):
+                if self.is_stale(catalog_number):
+                    self.refresh(catalog_number)
+            missing = [catalog_number for catalog_number in list(self._wanted) if catalog_number not in self._tles]
+            for catalog_number in missing:
+                with self._fetch_lock:
+                    self._refresh_missing(catalog_number)
+            time.sleep(min(self.retry_interval, self.missing_retry if missing else 60))
@@ -0,0 +1,86 @@
+import importlib
+import importlib.util
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+def write_atomic(filename, data):
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class LazyModule:
+    # Stands in for a module and imports it on first attribute access.
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def lazy_import(name):
+    # None if the package is not installed, like an optional import in a try/except ImportError.
+    if importlib.util.find_spec(name.split(".")[0]) is None:
+        return None
+    return LazyModule(name)
+
+
+fcntl = lazy_import("fcntl")
+_file_lock_fallback = threading.RLock()
+
+
+@contextmanager
+def file_lock(filename):
+    # An exclusive lock shared by every process and thread that opens the same file.
+    # Without fcntl (Windows) it only serializes threads of this process.
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    with open(filename, "a") as f:
+        if fcntl is None:
+            with _file_lock_fallback:
+                yield
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def memory_usage():
+    # Bytes of resident, proportional and private memory. Forked workers share pages with
+    # their parent, so PSS and private memory tell what each one really costs; those are
+    # only available on Linux, elsewhere this falls back to peak RSS.
+    try:
+        usage = {}
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    usage[name] = int(value.split()[0]) * 1024
+        return {"rss": usage["Rss"], "pss": usage["Pss"], "private": usage["Private_Clean"] + usage["Private_Dirty"]}
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return {}
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"rss": peak if sys.platform == "darwin" else peak * 1024}
+
+
+def format_memory(usage):
+    return ", ".join(f"{kind.upper()} {value / 1024 ** 2:.0f} MB" for kind, value in usage.items()) or "memory unknown"
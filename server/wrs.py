@@ -0,0 +1,237 @@
+import os
+import struct
+import threading
+
+import numpy as np
+
+
+WRS_BASENAME = "WRS2_descending"
+WRS_DOWNLOAD_URL = "https://www.usgs.gov/landsat-missions/landsat-shapefiles-and-kml-files"
+CACHE_VERSION = 1
+
+
+def read_dbf(filename, fields):
+    with open(filename, "rb") as f:
+        data = f.read()
+    num_records, header_length, record_length = struct.unpack("<IHH", data[4:12])
+
+    dtype = [("deleted", "S1")]
+    offset = 32
+    while data[offset] != 0x0D:
+        name = data[offset:offset + 11].split(b"\0", 1)[0].decode("ascii")
+        length = data[offset + 16]
+        dtype.append((name, f"S{length}"))
+        offset += 32
+    dtype = np.dtype(dtype)
+    if dtype.itemsize != record_length:
+        raise ValueError(f"Unexpected DBF record length in {filename}")
+
+    records = np.frombuffer(data, dtype=dtype, count=num_records, offset=header_length)
+    return {field: np.char.strip(records[field].astype(str)) for field in fields if field in dtype.names}
+
+
+def read_polygons(filename):
+    with open(filename, "rb") as f:
+        data = f.read()
+    shape_type = struct.unpack("<i", data[32:36])[0]
+    if shape_type != 5:
+        raise ValueError(f"{filename} is not a polygon shapefile")
+
+    rings = []
+    feature_rings = [0]
+    offset = 100
+    while offset < len(data):
+        content_length = struct.unpack(">i", data[offset + 4:offset + 8])[0] * 2
+        content = offset + 8
+        record_type = struct.unpack("<i", data[content:content + 4])[0]
+        if record_type == 5:
+            num_parts, num_points = struct.unpack("<ii", data[content + 36:content + 44])
+            parts = np.frombuffer(data, dtype="<i4", count=num_parts, offset=content + 44)
+            points = np.frombuffer(data, dtype="<f8", count=num_points * 2,
+                                   offset=content + 44 + 4 * num_parts).reshape(-1, 2)
+            for start, end in zip(parts, list(parts[1:]) + [num_points]):
+                rings.append(points[start:end])
+        feature_rings.append(len(rings))
+        offset = content + content_length
+
+    ring_offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+    ring_offsets[1:] = np.cumsum([len(ring) for ring in rings])
+    return np.concatenate(rings), ring_offsets, np.array(feature_rings, dtype=np.int64)
+
+
+def ring_centroid(points):
+    x, y = points[:, 0], points[:, 1]
+    cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+    area = cross.sum() / 2
+    if area == 0:
+        return x.mean(), y.mean()
+    return ((x[:-1] + x[1:]) * cross).sum() / (6 * area), ((y[:-1] + y[1:]) * cross).sum() / (6 * area)
+
+
+def build_index(points, ring_offsets, feature_rings, paths, rows, cell_size=1.0):
+    # Rings that cross the antimeridian are unwrapped to [0, 360) and also indexed
+    # shifted by -360, so every query point falls inside exactly one copy.
+    x1, y1, x2, y2, edge_offsets, edge_rings = [], [], [], [], [0], []
+    bboxes = []
+    centers = np.zeros((len(paths), 2))
+    for feature in range(len(paths)):
+        largest = None
+        for ring in range(feature_rings[feature], feature_rings[feature + 1]):
+            ring_points = points[ring_offsets[ring]:ring_offsets[ring + 1]].copy()
+            copies = [ring_points]
+            if np.ptp(ring_points[:, 0]) > 180:
+                ring_points[ring_points[:, 0] < 0, 0] += 360
+                shifted = ring_points.copy()
+                shifted[:, 0] -= 360
+                copies = [ring_points, shifted]
+            if largest is None or len(ring_points) > len(largest):
+                largest = ring_points
+            for copy in copies:
+                x1.append(copy[:-1, 0])
+                y1.append(copy[:-1, 1])
+                x2.append(copy[1:, 0])
+                y2.append(copy[1:, 1])
+                edge_offsets.append(edge_offsets[-1] + len(copy) - 1)
+                edge_rings.append(feature)
+                bboxes.append((copy[:, 0].min(), copy[:, 1].min(), copy[:, 0].max(), copy[:, 1].max()))
+        if largest is not None:
+            lon, lat = ring_centroid(largest)
+            centers[feature] = (lat, (lon + 180) % 360 - 180)
+
+    # Uniform grid of cell_size degrees, stored as CSR arrays: cell -> ring copies.
+    num_cols, num_rows = int(round(360 / cell_size)), int(round(180 / cell_size))
+    cells = []
+    for ring, (min_x, min_y, max_x, max_y) in enumerate(bboxes):
+        col0 = max(int(np.floor((min_x + 180) / cell_size)), 0)
+        col1 = min(int(np.floor((max_x + 180) / cell_size)), num_cols - 1)
+        row0 = max(int(np.floor((min_y + 90) / cell_size)), 0)
+        row1 = min(int(np.floor((max_y + 90) / cell_size)), num_rows - 1)
+        for grid_row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                cells.append((grid_row * num_cols + col, ring))
+    cells = np.array(sorted(cells), dtype=np.int64).reshape(-1, 2)
+    cell_offsets = np.searchsorted(cells[:, 0], np.arange(num_cols * num_rows + 1)).astype(np.int64)
+
+    return {
+        "version": np.array(CACHE_VERSION),
+        "cell_size": np.array(cell_size),
+        "edges": np.stack([np.concatenate(x1), np.concatenate(y1), np.concatenate(x2), np.concatenate(y2)]).astype(np.float32),
+        "edge_offsets": np.array(edge_offsets, dtype=np.int64),
+        "edge_features": np.array(edge_rings, dtype=np.int32),
+        "cell_offsets": cell_offsets,
+        "cell_rings": cells[:, 1].astype(np.int32),
+        "paths": paths.astype(np.int16),
+        "rows": rows.astype(np.int16),
+        "centers": centers,
+        "points": points,
+        "ring_offsets": ring_offsets,
+        "feature_rings": feature_rings,
+    }
+
+
+class WRSIndex:
+    def __init__(self, arrays):
+        for name, value in arrays.items():
+            setattr(self, name, value)
+        self.cell_size = float(self.cell_size)
+        self.num_cols = int(round(360 / self.cell_size))
+        self.tiles = {(int(path), int(row)): i for i, (path, row) in enumerate(zip(self.paths, self.rows))}
+
+    @classmethod
+    def load(cls, wrs_dir, cache_dir):
+        shp = os.path.join(wrs_dir, WRS_BASENAME + ".shp")
+        dbf = os.path.join(wrs_dir, WRS_BASENAME + ".dbf")
+        if not os.path.exists(shp) or not os.path.exists(dbf):
+            raise FileNotFoundError(f"{WRS_BASENAME}.shp and .dbf are required in {wrs_dir}; "
+                                    f"they are in {WRS_BASENAME}_0.zip at {WRS_DOWNLOAD_URL}")
+
+        stat = os.stat(shp)
+        cache = os.path.join(cache_dir, f"wrs2_descending_{stat.st_size}_{int(stat.st_mtime)}.npz")
+        if os.path.exists(cache):
+            with np.load(cache) as arrays:
+                if int(arrays["version"]) == CACHE_VERSION:
+                    return cls(dict(arrays))
+
+        points, ring_offsets, feature_rings = read_polygons(shp)
+        attributes = read_dbf(dbf, ["PATH", "ROW", "MODE"])
+        paths = attributes["PATH"].astype(float).astype(int)
+        rows = attributes["ROW"].astype(float).astype(int)
+        if "MODE" in attributes:
+            # Keep only descending (daytime) footprints, like the map service query.
+            keep = np.flatnonzero(attributes["MODE"] == "D")
+            ring_counts = np.diff(feature_rings)[keep]
+            ring_index = np.concatenate([np.arange(feature_rings[i], feature_rings[i + 1]) for i in keep])
+            point_index = np.concatenate([np.arange(ring_offsets[r], ring_offsets[r + 1]) for r in ring_index])
+            ring_sizes = np.diff(ring_offsets)[ring_index]
+            points = points[point_index]
+            ring_offsets = np.concatenate([[0], np.cumsum(ring_sizes)])
+            feature_rings = np.concatenate([[0], np.cumsum(ring_counts)])
+            paths, rows = paths[keep], rows[keep]
+
+        arrays = build_index(points, ring_offsets, feature_rings, paths, rows)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = cache + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, cache)
+        return cls(arrays)
+
+    def lookup(self, latitude, longitude):
+        longitude = (longitude + 180) % 360 - 180
+        col = min(int((longitude + 180) // self.cell_size), self.num_cols - 1)
+        row = min(int((latitude + 90) // self.cell_size), int(round(180 / self.cell_size)) - 1)
+        cell = row * self.num_cols + col
+        rings = self.cell_rings[self.cell_offsets[cell]:self.cell_offsets[cell + 1]]
+        if len(rings) == 0:
+            return []
+
+        starts, ends = self.edge_offsets[rings], self.edge_offsets[rings + 1]
+        edge_index = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        x1, y1, x2, y2 = self.edges[:, edge_index]
+        # Even-odd ray casting towards +x, summed per ring.
+        straddles = (y1 > latitude) != (y2 > latitude)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = x1 + (latitude - y1) * (x2 - x1) / (y2 - y1)
+        crossings = (straddles & (longitude < x_cross)).astype(np.int32)
+        counts = np.add.reduceat(crossings, np.concatenate([[0], np.cumsum(ends - starts)[:-1]]))
+        features = np.unique(self.edge_features[rings[counts % 2 == 1]])
+        return [(int(self.paths[i]), int(self.rows[i])) for i in features]
+
+    def feature(self, path, row):
+        return self.tiles.get((int(path), int(row)))
+
+    def center(self, path, row):
+        feature = self.feature(path, row)
+        if feature is None:
+            return None
+        latitude, longitude = self.centers[feature]
+        return float(latitude), float(longitude)
+
+    def footprint(self, path, row):
+        feature = self.feature(path, row)
+        if feature is None:
+            return None
+        polygons = []
+        for ring in range(self.feature_rings[feature], self.feature_rings[feature + 1]):
+            ring_points = self.points[self.ring_offsets[ring]:self.ring_offsets[ring + 1]]
+            polygons.append([ring_points.tolist()])
+        if len(polygons) == 1:
+            return {"type": "Polygon", "coordinates": polygons[0]}
+        return {"type": "MultiPolygon", "coordinates": polygons}
+
+
+_index = None
+_index_error = None
+_index_lock = threading.Lock()
+
+
+def get_wrs_index(wrs_dir, cache_dir):
+    global _index, _index_error
+    if _index is None and _index_error is None:
+        with _index_lock:
+            if _index is None and _index_error is None:
+                try:
+                    _index = WRSIndex.load(wrs_dir, cache_dir)
+                except (OSError, ValueError) as e:
+                    _index_error = e
+                    print(f"WRS-2 index unavailable: {e}")
+    return _index
@@ -0,0 +1,24 @@
+import os
+import time
+
+STARTED = time.perf_counter()
+
+
+def create_app(warmup=True):
+    # Entry point for production WSGI servers, e.g.
+    #   gunicorn -c gunicorn.conf.py "wsgi:create_app()"
+    # Importing app loads the libraries and sets up shared state; warmup then loads
+    # the data every request needs. With a preloading server both happen once, in the
+    # parent, and forked workers share the memory.
+    import app as application
+    from metrics import STARTUP_SECONDS
+    from utils import format_memory, memory_usage
+
+    imported = time.perf_counter()
+    STARTUP_SECONDS.set(imported - STARTED, phase="import")
+    if warmup:
+        application.warmup()
+        STARTUP_SECONDS.set(time.perf_counter() - imported, phase="warmup")
+    print(f"App ready in {time.perf_counter() - STARTED:.2f}s (import {imported - STARTED:.2f}s) "
+          f"in process {os.getpid()}: {format_memory(memory_usage())}")
+    return application.app